@@ -0,0 +1,62 @@
+"""
+Startup benchmark for cts_envipath_flask.
+
+Measures, each in a fresh interpreter, the time to import the app and the time
+until the first /envipath/test response, and checks them against budgets.
+Heavy modules (pandas, numpy) must not be imported before first use.
+
+    python benchmarks/startup.py [runs]
+
+Budgets in milliseconds can be overridden with IMPORT_BUDGET_MS and FIRST_RESPONSE_BUDGET_MS.
+Exits with status 1 if a budget is exceeded.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 500))
+FIRST_RESPONSE_BUDGET_MS = float(os.environ.get("FIRST_RESPONSE_BUDGET_MS", 600))
+DEFERRED_MODULES = ["pandas", "numpy"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import cts_envipath_flask
+imported = time.perf_counter()
+with cts_envipath_flask.app.test_client() as client:
+    assert client.get("/envipath/test").status_code == 200
+responded = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (responded - start) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % DEFERRED_MODULES
+
+
+def probe(root):
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [probe(root) for _ in range(runs)]
+
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    first_response_ms = statistics.median(r["first_response_ms"] for r in results)
+    loaded = sorted(set(m for r in results for m in r["loaded"]))
+
+    print("import:         {:8.1f} ms (budget {:.0f} ms)".format(import_ms, IMPORT_BUDGET_MS))
+    print("first response: {:8.1f} ms (budget {:.0f} ms)".format(first_response_ms, FIRST_RESPONSE_BUDGET_MS))
+    print("deferred modules loaded at startup: {}".format(", ".join(loaded) or "none"))
+
+    ok = import_ms <= IMPORT_BUDGET_MS and first_response_ms <= FIRST_RESPONSE_BUDGET_MS and not loaded
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
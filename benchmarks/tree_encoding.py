@@ -0,0 +1,76 @@
+"""
+Encode/decode benchmark of the binary tree format against the JSON path
+used by get_envipath_tree (json.dumps(default=__dict__)).
+
+    python benchmarks/tree_encoding.py [nodes] [runs]
+
+Builds a synthetic pathway with rules from paths.pkl and reports the median
+encode and decode times as well as raw and gzipped payload sizes.
+"""
+import os
+import sys
+import gzip
+import json
+import random
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from envipath_tree.tree import Tree
+from envipath_tree.binary import encode_tree, decode_tree
+
+
+def synthetic_tree(num_nodes, df_paths, seed=42):
+    r = random.Random(seed)
+    rules = list(df_paths.index)
+    nodes = [{"id": "https://envipath.org/node/0", "depth": 0, "smiles": "c1ccccc1",
+              "image": "https://envipath.org/depict?smiles=0", "proposed": []}]
+    links = list()
+    for idx in range(1, num_nodes):
+        source = r.randrange(max(1, idx // 2))
+        nodes.append({"id": "https://envipath.org/node/{}".format(idx), "depth": nodes[source]["depth"] + 1,
+                      "smiles": "C" * (idx % 17 + 1) + "O" * (idx % 5), "atomCount": idx % 30,
+                      "image": "https://envipath.org/depict?smiles={}".format(idx), "proposed": []})
+        links.append({"id": "https://envipath.org/edge/{}".format(idx), "source": source, "target": idx,
+                      "pseudo": False, "rule": r.choice(rules)})
+    tree = Tree(nodes, links, df_paths)
+    tree.build_tree()
+    return tree.root_node
+
+
+def median_ms(func, runs):
+    timings = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    root_node = synthetic_tree(num_nodes, pd.read_pickle(os.path.join(root, "paths.pkl")))
+
+    json_data = json.dumps(root_node, default=lambda o: o.__dict__).encode()
+    binary_data = encode_tree(root_node)
+    assert decode_tree(binary_data) == json.loads(json_data)
+
+    rows = [
+        ("json", median_ms(lambda: json.dumps(root_node, default=lambda o: o.__dict__), runs),
+         median_ms(lambda: json.loads(json_data), runs), json_data),
+        ("binary", median_ms(lambda: encode_tree(root_node), runs),
+         median_ms(lambda: decode_tree(binary_data), runs), binary_data),
+    ]
+
+    print("{:8} {:>12} {:>12} {:>12} {:>12}".format("format", "encode ms", "decode ms", "bytes", "gzip bytes"))
+    for name, encode_ms, decode_ms, data in rows:
+        print("{:8} {:12.2f} {:12.2f} {:12d} {:12d}".format(name, encode_ms, decode_ms, len(data),
+                                                             len(gzip.compress(data))))
+
+
+if __name__ == "__main__":
+    main()
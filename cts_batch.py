@@ -0,0 +1,78 @@
+"""
+Offline batch predictions, without going through the Flask service:
+
+    python cts_batch.py compounds.txt -o results.jsonl --workers 4
+
+Takes the same TXT/CSV input as cts_prewarm.py and writes one JSON line per
+(SMILES, gen_limit) with the tree (or error), timings and with --summary the
+table of unique metabolites. Running again with the
+same output file resumes: compounds already written successfully are skipped and
+failed ones are tried again, the last line of a compound is its current result.
+"""
+import os
+import json
+import time
+import argparse
+from cts_envipath import CTSEnvipath, error_message
+from cts_prewarm import ProgressLog, read_compounds, run_jobs
+
+
+def predict(ctsenvipath, smiles, gen_limit, shape, timeout=None, summary=False):
+    """
+    Returns (status, fields) of one compound, fields holding the tree or error and timings.
+    """
+    start = time.time()
+    timings = {"polls": 0}
+    try:
+        for event, data in ctsenvipath.iter_envipath_tree(smiles, gen_limit, shape, summary=summary, timeout=timeout):
+            if event == "progress":
+                if data["poll"] == 0:
+                    timings["submitted_s"] = time.time() - start
+                timings["polls"] = data["poll"]
+            elif event == "result":
+                result = json.loads(data)
+    except Exception as e:
+        timings["total_s"] = time.time() - start
+        return "error", {"error": error_message(e), "timings": timings}
+
+    timings["total_s"] = time.time() - start
+    timings["cached"] = "submitted_s" not in timings
+    if summary and shape == "tree":
+        return "ok", {"tree": result["tree"], "summary": result["summary"], "timings": timings}
+    return "ok", {"tree": result, "timings": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs CTS enviPath predictions for a file of SMILES into JSONL.")
+    parser.add_argument("compounds", help="TXT file with one SMILES per line or CSV with smiles[,gen_limit]")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file the results are appended to")
+    parser.add_argument("--gen-limit", type=int, nargs="+", default=[1],
+                        help="gen_limits to predict for SMILES without one (default: 1)")
+    parser.add_argument("--shape", default="tree", help="result shape, tree or dag")
+    parser.add_argument("--workers", type=int, default=4, help="predictions running at once")
+    parser.add_argument("--timeout", type=float, help="seconds a single prediction may take")
+    parser.add_argument("--summary", action="store_true",
+                        help="also write the table of unique metabolites (Tree.metabolite_table) as summary")
+    parser.add_argument("--restart", action="store_true", help="ignore results already in the output file")
+    args = parser.parse_args()
+    if args.summary and args.shape != "tree":
+        parser.error("--summary is only available for --shape tree")
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+
+    ctsenvipath = CTSEnvipath()
+    ctsenvipath.warm_up()
+
+    output = ProgressLog(args.output)
+    compounds = read_compounds(args.compounds, args.gen_limit)
+    num_jobs, failed = run_jobs(output, compounds, lambda smiles, gen_limit: predict(
+        ctsenvipath, smiles, gen_limit, args.shape, args.timeout, args.summary), args.workers, shape=args.shape,
+        summary=args.summary)
+
+    print("predicted {}, failed {}".format(num_jobs - failed, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
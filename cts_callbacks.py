@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+import ipaddress
+import requests
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from cts_result_cache import SQLiteStore
+
+
+def check_callback_url(callback_url, allowed_hosts=()):
+    """
+    Raises ValueError unless callback_url is an http(s) url of a public host.
+    Hosts resolving to private, loopback, link-local or otherwise reserved addresses
+    are rejected, except for those in allowed_hosts.
+    """
+    parts = urlsplit(callback_url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError("Callback url must be http or https")
+    if not parts.hostname:
+        raise ValueError("Callback url has no host")
+    if parts.hostname in allowed_hosts:
+        return
+
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError("Callback host {} does not resolve: {}".format(parts.hostname, e))
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError("Callback host {} is not a public address".format(parts.hostname))
+
+
+class CallbackStore(SQLiteStore):
+    """
+    Callback jobs and their delivery log, in the result cache's SQLite file so
+    that every worker process sees them and queued jobs outlive a worker.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS callback_jobs ("
+        "job_id TEXT PRIMARY KEY, smiles TEXT NOT NULL, gen_limit INTEGER, callback_url TEXT NOT NULL, "
+        "options TEXT NOT NULL, state TEXT NOT NULL, claimed REAL, created REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_callback_jobs_state ON callback_jobs (state)",
+        "CREATE TABLE IF NOT EXISTS callback_log ("
+        "job_id TEXT NOT NULL, callback_url TEXT NOT NULL, state TEXT NOT NULL, attempt INTEGER, "
+        "status_code INTEGER, error TEXT, time REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_callback_log_job ON callback_log (job_id)",
+    )
+
+    def add_job(self, job_id, smiles, gen_limit, callback_url, options):
+        conn = self.connection()
+        conn.execute("INSERT INTO callback_jobs (job_id, smiles, gen_limit, callback_url, options, state, created) "
+                     "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                     (job_id, smiles, gen_limit, callback_url, json.dumps(options), time.time()))
+        conn.commit()
+
+    def claim(self, job_id, stale_before):
+        """
+        Marks a job as running and returns it, or None if it is done or another worker runs it.
+        Jobs claimed before stale_before are taken over, their worker is assumed dead.
+        """
+        conn = self.connection()
+        cursor = conn.execute("UPDATE callback_jobs SET state = 'running', claimed = ? WHERE job_id = ? AND "
+                              "(state = 'queued' OR (state = 'running' AND claimed < ?))",
+                              (time.time(), job_id, stale_before))
+        conn.commit()
+        if cursor.rowcount != 1:
+            return None
+        row = conn.execute("SELECT smiles, gen_limit, callback_url, options FROM callback_jobs WHERE job_id = ?",
+                           (job_id,)).fetchone()
+        return {"smiles": row[0], "gen_limit": row[1], "callback_url": row[2], "options": json.loads(row[3])}
+
+    def finish(self, job_id, state):
+        conn = self.connection()
+        conn.execute("UPDATE callback_jobs SET state = ? WHERE job_id = ?", (state, job_id))
+        conn.commit()
+
+    def runnable(self, stale_before):
+        """
+        Ids of jobs waiting to run, including those whose worker went away.
+        """
+        rows = self.connection().execute(
+            "SELECT job_id FROM callback_jobs WHERE state = 'queued' OR (state = 'running' AND claimed < ?) "
+            "ORDER BY created", (stale_before,)).fetchall()
+        return [row[0] for row in rows]
+
+    def log(self, entry):
+        conn = self.connection()
+        conn.execute("INSERT INTO callback_log (job_id, callback_url, state, attempt, status_code, error, time) "
+                     "VALUES (:job_id, :callback_url, :state, :attempt, :status_code, :error, :time)", entry)
+        conn.commit()
+
+    def get_log(self, job_id=None):
+        columns = ["job_id", "callback_url", "state", "attempt", "status_code", "error", "time"]
+        query = "SELECT {} FROM callback_log".format(", ".join(columns))
+        if job_id is None:
+            rows = self.connection().execute(query + " ORDER BY rowid").fetchall()
+        else:
+            rows = self.connection().execute(query + " WHERE job_id = ? ORDER BY rowid", (job_id,)).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def prune(self, before):
+        """
+        Drops finished jobs and log entries older than before.
+        """
+        conn = self.connection()
+        conn.execute("DELETE FROM callback_jobs WHERE state IN ('delivered', 'abandoned') AND created < ?", (before,))
+        conn.execute("DELETE FROM callback_log WHERE time < ?", (before,))
+        conn.commit()
+
+
+class CallbackDispatcher:
+    """
+    Runs predictions in the background and POSTs the finished tree (or error)
+    to a client supplied callback url.
+    Jobs are kept in a CallbackStore. Every worker process checks it for jobs left
+    queued, or left running by a worker that went away, and runs them.
+    """
+
+    def __init__(self, ctsenvipath, path=None, max_workers=4, retries=5, backoff=2, timeout=10,
+                 poll_interval=30, stale_after=3600, log_ttl=7 * 24 * 3600):
+        self.ctsenvipath = ctsenvipath
+        self.store = CallbackStore(path if path is not None else ctsenvipath.result_cache.path)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.log_ttl = log_ttl
+        #Hosts allowed as callback targets even though they are not public, e.g. other CTS containers
+        self.allowed_hosts = {host.strip() for host in os.environ.get("CALLBACK_ALLOWED_HOSTS", "").split(",")
+                              if host.strip()}
+
+        #Executor and job poller of the current process, see start()
+        self.executor = None
+        self.pid = None
+        #Job ids handed to the executor and not yet started
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the executor and the job poller of the current process, e.g. in every forked worker.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self.pending = set()
+        threading.Thread(target=self.poll_jobs, name="callback-poller", daemon=True).start()
+
+    def submit(self, smiles, gen_limit, callback_url, **options):
+        """
+        Queues a prediction and returns its job id right away.
+        options are passed on to CTSEnvipath.get_envipath_result (shape, tree build options, timeout).
+        Raises ValueError if callback_url is not allowed.
+        """
+        check_callback_url(callback_url, self.allowed_hosts)
+        self.start()
+        job_id = str(uuid.uuid4())
+        self.store.add_job(job_id, smiles, gen_limit, callback_url, options)
+        self.log(job_id, callback_url, "queued")
+        self.enqueue(job_id)
+        return job_id
+
+    def enqueue(self, job_id):
+        with self.lock:
+            if job_id in self.pending:
+                return
+            self.pending.add(job_id)
+        self.executor.submit(self.run, job_id)
+
+    def poll_jobs(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                for job_id in self.store.runnable(time.time() - self.stale_after):
+                    self.enqueue(job_id)
+                self.store.prune(time.time() - self.log_ttl)
+            except Exception as e:
+                logging.warning("Could not check callback jobs: {}".format(e))
+
+    def run(self, job_id):
+        with self.lock:
+            self.pending.discard(job_id)
+        job = self.store.claim(job_id, time.time() - self.stale_after)
+        if job is None:
+            return
+
+        delivered = False
+        try:
+            smiles, gen_limit = job["smiles"], job["gen_limit"]
+            tree_dict = json.loads(self.ctsenvipath.get_envipath_result(smiles, gen_limit, **job["options"])[0])
+            payload = {
+                "job_id": job_id,
+                "smiles": smiles,
+                "gen_limit": gen_limit,
+                "status": "error" not in tree_dict,
+                "data": tree_dict,
+            }
+            delivered = self.deliver(job_id, job["callback_url"], payload)
+        except Exception as e:
+            logging.warning("Callback job {} failed: {}".format(job_id, e))
+        finally:
+            self.store.finish(job_id, "delivered" if delivered else "abandoned")
+
+    def deliver(self, job_id, callback_url, payload):
+        """
+        POSTs the payload, retrying with exponential backoff.
+        """
+        try:
+            #Checked again, the host may resolve differently by now
+            check_callback_url(callback_url, self.allowed_hosts)
+        except ValueError as e:
+            self.log(job_id, callback_url, "abandoned", error=str(e))
+            return False
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = requests.post(callback_url, json=payload, timeout=self.timeout, allow_redirects=False)
+                response.raise_for_status()
+                self.log(job_id, callback_url, "delivered", attempt, response.status_code)
+                return True
+            except Exception as e:
+                logging.warning("Callback {} for job {} failed: {}".format(callback_url, job_id, e))
+                self.log(job_id, callback_url, "failed", attempt, error=str(e))
+                if attempt < self.retries:
+                    time.sleep(self.backoff ** attempt)
+
+        self.log(job_id, callback_url, "abandoned", self.retries)
+        return False
+
+    def log(self, job_id, callback_url, state, attempt=0, status_code=None, error=None):
+        entry = {
+            "job_id": job_id,
+            "callback_url": callback_url,
+            "state": state,
+            "attempt": attempt,
+            "status_code": status_code,
+            "error": error,
+            "time": time.time(),
+        }
+        try:
+            self.store.log(entry)
+        except Exception as e:
+            logging.warning("Could not log callback {}: {}".format(entry, e))
+
+    def get_log(self, job_id=None):
+        return self.store.get_log(job_id)
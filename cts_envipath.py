@@ -1,17 +1,32 @@
 import json
 import time
 import logging
-import pandas as pd
-import requests
 import os
-from pprint import pprint
-from enviPath_python.enviPath import *
-from enviPath_python.objects import *
-from envipath_tree.tree import Tree
+import threading
+from enviPath_python.enviPath import enviPath, DeadlineExceeded
+from enviPath_python.objects import Package, Setting
+from enviPath_python.scheduler import RequestScheduler
+from enviPath_python.mirror import MirrorRequester
+from envipath_tree.tree import Tree, TreeTooLargeError
+from envipath_tree.rule_index import RuleIndex
+from cts_pathway_index import PathwayIndex
+from cts_result_cache import ResultCache
 
 # Define the instance to use
 INSTANCE_HOST = 'https://envipath.org/'
 
+
+class PredictionCancelled(Exception):
+    pass
+
+
+def error_message(e):
+    """
+    Message of an exception as reported to clients.
+    """
+    return str(e.args[0]) if e.args else type(e).__name__
+
+
 class CTSEnvipath:
     def __init__(self):
         #We can pass this in or read from file if needed
@@ -30,6 +45,191 @@ class CTSEnvipath:
         self.settings["cts-d3-n64"] = INSTANCE_HOST + 'setting/' + 'b84c521c-a9cf-4f91-8eff-fd990edc4c34'
         self.settings["cts-d3-n128"] = INSTANCE_HOST + 'setting/' + '069ecbcf-1eb7-4ea5-8e53-08df41e6a871'
 
+        # Rule table and reaction -> rule index, loaded on first use by load_rules().
+        # The index file is best built offline (python -m envipath_tree.rule_index, from the mirror
+        # if ENVIPATH_MIRROR is set) and shipped or mounted at RULE_INDEX. Without it reactions are
+        # fetched one at a time and start_rule_index_build() builds the file in the background.
+        self.rule_index_path = os.environ.get('RULE_INDEX', 'reaction_rules.pkl')
+        self._df_paths = None
+        self._rule_index = None
+        self.rule_index_built = False
+        self.rules_lock = threading.Lock()
+
+        # Result shapes, see iter_envipath_tree()
+        self.shapes = ["tree", "dag"]
+
+        # Rate limit of requests to enviPath, in requests per second for the whole service,
+        # split between the worker processes. Categories can be limited further.
+        workers = int(os.environ.get('WORKERS', 1))
+        limits = dict()
+        for category in RequestScheduler.CATEGORIES:
+            limit = os.environ.get('ENVIPATH_RATE_' + category.upper())
+            if limit:
+                limits[category] = float(limit) / workers
+        self.scheduler = RequestScheduler(float(os.environ.get('ENVIPATH_RATE', 5)) / workers, limits=limits)
+
+        # Pathways already predicted in the package, to avoid predicting them again
+        self.pathway_index = PathwayIndex(scheduler=self.scheduler)
+
+        # Optional local mirror of the package (python -m enviPath_python.mirror), reactions are
+        # looked up there before they are fetched from enviPath
+        self.mirror = None
+        mirror_path = os.environ.get('ENVIPATH_MIRROR')
+        if mirror_path:
+            try:
+                self.mirror = MirrorRequester(mirror_path)
+            except ValueError as e:
+                logging.warning("Not using mirror: {}".format(e))
+
+        # Finished trees, shared between worker processes
+        self.result_cache = ResultCache(os.environ.get('RESULT_CACHE', 'results.db'))
+
+        # Ceilings on the nodes of a built tree and the bytes of a result, 0 for none.
+        # Results over them are answered with a "Result too large" error.
+        self.max_tree_nodes = int(os.environ.get('TREE_MAX_NODES', 0)) or None
+        self.max_response_bytes = int(os.environ.get('RESPONSE_MAX_BYTES', 0)) or None
+
+        # Seconds a prediction may take at most, 0 for no limit, and seconds between polls.
+        # Predictions that time out or are cancelled can be deleted from the package.
+        self.prediction_timeout = int(os.environ.get('PREDICTION_TIMEOUT', 900)) or None
+        self.poll_interval = 10
+        self.delete_unfinished = os.environ.get('DELETE_UNFINISHED', '') in ('1', 'true')
+
+        # Logged in enviPath client shared between requests
+        self.client = None
+        self.client_time = 0
+        self.client_ttl = int(os.environ.get('ENVIPATH_CLIENT_TTL', 3600))
+        self.client_lock = threading.Lock()
+
+    def load_rules(self):
+        """
+        Loads the dataframe of eawag rules called "paths" and the reaction -> rule index built from it.
+        pandas is only imported here so that importing this module stays fast.
+        """
+        with self.rules_lock:
+            if self._rule_index is None:
+                import pandas as pd
+                self._df_paths = pd.read_pickle('paths.pkl')
+                self.rule_index_built = os.path.exists(self.rule_index_path)
+                self._rule_index = RuleIndex.load(self.rule_index_path, self._df_paths)
+
+    def refresh_rule_index(self):
+        """
+        Loads the rule index file once it exists if the index was started without it,
+        keeping the reactions fetched meanwhile.
+        """
+        if self._rule_index is None or self.rule_index_built or not os.path.exists(self.rule_index_path):
+            return
+        with self.rules_lock:
+            if not self.rule_index_built:
+                rule_index = RuleIndex.load(self.rule_index_path, self._df_paths)
+                rule_index.reactions.update(self._rule_index.reactions)
+                self._rule_index = rule_index
+                self.rule_index_built = True
+
+    def build_rule_index(self):
+        """
+        Builds the reaction -> rule index from all reactions of the package, read from
+        the mirror if there is one, and saves it to rule_index_path for later starts.
+        """
+        if self.mirror is not None:
+            package = Package(self.mirror, id=self.package_id)
+        else:
+            package = self.get_client().get_package(self.package_id)
+        with self.scheduler.category('enrich'):
+            rule_index = RuleIndex.build(package.get_reactions(), self.df_paths)
+        rule_index.save(self.rule_index_path)
+        with self.rules_lock:
+            self._rule_index = rule_index
+            self.rule_index_built = True
+        return rule_index
+
+    def start_rule_index_build(self):
+        """
+        Builds the missing rule index file in a background thread, so that starting up does not wait for it.
+        Of several worker processes only one builds it, the others load it once it exists.
+        """
+        if os.path.exists(self.rule_index_path):
+            return
+        threading.Thread(target=self.run_rule_index_build, name="rule-index", daemon=True).start()
+
+    def run_rule_index_build(self):
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        with open(self.rule_index_path + '.lock', 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Another process is building it
+                    return
+            if os.path.exists(self.rule_index_path):
+                return
+            try:
+                rule_index = self.build_rule_index()
+                logging.warning("Built rule index of {} reactions".format(len(rule_index.reactions)))
+            except Exception as e:
+                logging.warning("Could not build rule index: {}".format(e))
+
+    @property
+    def df_paths(self):
+        if self._df_paths is None:
+            self.load_rules()
+        return self._df_paths
+
+    @property
+    def rule_index(self):
+        if self._rule_index is None:
+            self.load_rules()
+        return self._rule_index
+
+    def get_client(self, deadline=None):
+        """
+        Returns a logged in enviPath client, shared between requests
+        and logged in again after client_ttl seconds.
+        """
+        with self.client_lock:
+            if self.client is None or time.time() - self.client_time > self.client_ttl:
+                #These are for the enviPath user account
+                username = os.environ['USERNAME']
+                pwd = os.environ['PASSWORD']
+
+                ep = enviPath(INSTANCE_HOST, scheduler=self.scheduler)
+                # Everything else waits for the login, let it go first
+                with ep.requester.deadline(deadline), self.scheduler.category('submit'):
+                    ep.login(username, pwd)
+                self.client = ep
+                self.client_time = time.time()
+            return self.client
+
+    def warm_up(self):
+        """
+        Loads shared state ahead of the first request: the rule table and index,
+        a logged in client and the index of the package's pathways.
+        A missing rule index file is not built here, see start_rule_index_build().
+        """
+        self.load_rules()
+        try:
+            ep = self.get_client()
+            self.pathway_index.refresh(ep.get_package(self.package_id))
+        except Exception as e:
+            logging.warning("Warm up failed: {}".format(e))
+
+    def start_indexing(self):
+        """
+        Keeps the pathway index of the current process up to date in the background.
+        """
+        self.pathway_index.start(lambda: self.get_client().get_package(self.package_id))
+
+    def reset_connections(self):
+        """
+        Drops pooled connections inherited from a parent process, keeping the login cookies.
+        """
+        if self.client is not None:
+            self.client.requester.session.close()
+
     def set_setting_id(self, gen_limit):
         """
         Gets proper setting based on generation limit.
@@ -42,85 +242,324 @@ class CTSEnvipath:
             logging.warning("gen_limit < 1 or > 2. defaulting to cts-d2-n64") 
             return "cts-d2-n64"
 
-    def get_envipath_tree(self, smiles, gen_limit):
+    def progress(self, idx, json_retval, seen_smiles):
+        """
+        Summarizes a pathway snapshot, listing metabolites not seen in earlier snapshots.
+        """
+        nodes = json_retval.get('nodes', [])
+        new_metabolites = list()
+        for node in nodes:
+            node_smiles = node.get('smiles')
+            if node_smiles and node_smiles not in seen_smiles:
+                seen_smiles.add(node_smiles)
+                new_metabolites.append(node_smiles)
+
+        return {
+            "poll": idx,
+            "completed": json_retval['completed'],
+            "num_nodes": len(nodes),
+            "num_links": len(json_retval.get('links', [])),
+            "new_metabolites": new_metabolites,
+        }
+
+    def update_tree(self, ep, cts_envipath_tree, json_retval):
+        """
+        Adds the nodes and links of a pathway snapshot to the tree, creating it on the first call.
+        """
+        nodes = json_retval.get('nodes', [])
+        links = json_retval.get('links', [])
+        self.resolve_rules(links, ep)
+
+        if cts_envipath_tree is None:
+            return Tree(nodes, links, self.df_paths, self.rule_index, self.max_tree_nodes)
+        cts_envipath_tree.update(nodes, links)
+        return cts_envipath_tree
+
+    def dump_result(self, result):
+        """
+        Serializes a result (Node or dict), raising TreeTooLargeError over max_response_bytes.
+        """
+        result_json = json.dumps(result, default=lambda o: o.__dict__)
+        if self.max_response_bytes is not None and len(result_json) > self.max_response_bytes:
+            raise TreeTooLargeError("Result too large: {} bytes exceeds {} bytes".format(
+                len(result_json), self.max_response_bytes))
+        return result_json
+
+    def dump_tree(self, cts_envipath_tree, root_node, summary=False):
+        """
+        Serializes a built tree, together with its unique metabolite table if summary is set.
+        """
+        if summary:
+            return self.dump_result({"tree": root_node, "summary": cts_envipath_tree.metabolite_table()})
+        return self.dump_result(root_node)
+
+    def resolve_rules(self, links, ep=None):
+        """
+        Adds the reactions of links not yet in the rule index, from the mirror if it has them, else from enviPath.
+        """
+        # Only reactions not yet in the index need to be fetched
+        self.refresh_rule_index()
+        for idreaction in self.rule_index.missing(links):
+            reaction = self.get_mirrored_json(idreaction)
+            if reaction is None:
+                if ep is None:
+                    ep = self.get_client()
+                reaction = ep.requester.get_json(idreaction)
+            self.rule_index.add_reaction_json(reaction)
+
+    def get_mirrored_json(self, envipath_id):
+        """
+        Returns the JSON of an object from the mirror, or None without a mirror or if it is not mirrored.
+        """
+        if self.mirror is None:
+            return None
         try:
+            return self.mirror.get_json(envipath_id)
+        except ValueError:
+            return None
+
+    def check_options(self, shape="tree", depth=None, min_likelihood=None, top_k=None, max_nodes=None,
+                      score=False, summary=False, timeout=None):
+        """
+        Raises ValueError for an unknown shape or invalid options of iter_envipath_tree, including
+        tree build options given for another shape, so that bad requests fail before anything is sent to enviPath.
+        """
+        if shape not in self.shapes:
+            raise ValueError("Unknown result shape {}".format(shape))
+        if shape != "tree":
+            # The dag holds the whole pathway, tree build options do not apply to it
+            tree_only = [name for name, value in (("depth", depth), ("min_likelihood", min_likelihood),
+                                                  ("top_k", top_k), ("max_nodes", max_nodes), ("score", score),
+                                                  ("summary", summary)) if value not in (None, False)]
+            if tree_only:
+                raise ValueError("{} only apply to shape tree".format(", ".join(tree_only)))
+        Tree.check_options(depth, min_likelihood, top_k, max_nodes)
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError("timeout must be a positive number of seconds")
 
-            #These are for the enviPath user account
-            username = os.environ['USERNAME']
-            pwd = os.environ['PASSWORD']
+    @staticmethod
+    def result_key(setting_id, shape="tree", depth=None, min_likelihood=None, top_k=None, max_nodes=None,
+                   score=False, summary=False):
+        """
+        Cache key of a result: results of each shape and tree build option are cached separately.
+        """
+        result_key = setting_id if shape == "tree" else "{}:{}".format(setting_id, shape)
+        if shape == "tree":
+            for prefix, value in (("d", depth), ("l", min_likelihood), ("k", top_k), ("n", max_nodes),
+                                  ("s", 1 if score else None), ("m", 1 if summary else None)):
+                if value is not None:
+                    result_key = "{}:{}{}".format(result_key, prefix, value)
+        return result_key
+
+    def iter_envipath_tree(self, smiles, gen_limit, shape="tree", depth=None, min_likelihood=None, top_k=None,
+                           max_nodes=None, score=False, summary=False, timeout=None, cancelled=None):
+        """
+        Runs a prediction, yielding ("progress", dict) for every poll of the pathway,
+        then ("etag", dict) and finally ("result", json string).
+        The result is the nested metabolite tree, or with shape "dag" the flat
+        node and edge tables of Tree.to_dag().
+        With depth, the tree only expands that many generations below the root; nodes cut off
+        are marked as truncated and can be loaded later through get_subtree.
+        min_likelihood (e.g. "Likely"), top_k and max_nodes prune the tree while it is built,
+        see Tree.build_tree. With score, every metabolite carries its cumulative path likelihood
+        and that of its best path, see Tree.score_paths. With summary, the result is
+        {"tree": tree, "summary": Tree.metabolite_table()}, one record per unique metabolite.
+        All enviPath requests and the polling must finish within timeout seconds (at most
+        prediction_timeout), else DeadlineExceeded is raised. cancelled is an optional callable,
+        polled between requests, e.g. to stop once the client disconnected.
+        """
+        self.check_options(shape, depth, min_likelihood, top_k, max_nodes, score, summary, timeout)
 
-            ep = enviPath(INSTANCE_HOST)
-            ep.login(username, pwd)
+        if self.prediction_timeout is not None:
+            timeout = self.prediction_timeout if timeout is None else min(timeout, self.prediction_timeout)
+        deadline = time.monotonic() + timeout if timeout is not None else None
 
-            setting_id = self.set_setting_id(gen_limit)
+        ep = self.get_client(deadline)
+        self.start_indexing()
 
-            # Get package object
-            p = ep.get_package(self.package_id)
-            print("calling predict")
-            setting_url = self.settings[setting_id]
-            setting = Setting(ep.requester, id=setting_url)
-            #setting = ep.get_setting(self.settings[setting_id])
-            pw = p.predict(smiles, name='Pathway via REST', setting=setting, description='A pathway created via REST')
-            print("finished calling predict")
+        setting_id = self.set_setting_id(gen_limit)
+        result_key = self.result_key(setting_id, shape, depth, min_likelihood, top_k, max_nodes, score, summary)
+
+        # Pathway predicted by this call, until it completed
+        unfinished = None
+        try:
+            with ep.requester.deadline(deadline):
+                # Get package object
+                p = ep.get_package(self.package_id)
 
+                pw = self.pathway_index.find(p, smiles, setting_id)
+                if pw is not None:
+                    print("reusing pathway " + pw.get_id())
+                    cached = self.get_cached_result(pw, smiles, result_key)
+                    if cached is not None:
+                        yield "etag", {"etag": cached["etag"]}
+                        yield "result", cached["tree"]
+                        return
+                else:
+                    print("calling predict")
+                    setting_url = self.settings[setting_id]
+                    setting = Setting(ep.requester, id=setting_url)
+                    #setting = ep.get_setting(self.settings[setting_id])
+                    pw = p.predict(smiles, name='Pathway via REST', setting=setting,
+                                   description=PathwayIndex.description(setting_id, smiles))
+                    unfinished = pw
+                    self.pathway_index.add(smiles, setting_id, pw.get_id(), int(time.time() * 1000))
+                    print("finished calling predict")
+
+                cts_envipath_tree, json_retval = yield from self.poll_pathway(ep, pw, deadline, cancelled)
+                unfinished = None
+        finally:
+            if unfinished is not None:
+                self.discard_pathway(unfinished)
+
+        print("NumNode: " + str(len(json_retval['nodes'])))
+        print("NumLinks: " + str(len(json_retval['links'])))
+
+        if shape == "dag":
+            tree = self.dump_result(cts_envipath_tree.to_dag())
+        else:
+            cts_envipath_tree.build_tree(depth, min_likelihood, top_k, max_nodes)
+            if score:
+                cts_envipath_tree.score_paths()
+            tree = self.dump_tree(cts_envipath_tree, cts_envipath_tree.root_node, summary)
+
+        last_modified = json_retval.get('lastModified')
+        etag = ResultCache.make_etag(smiles, result_key, last_modified)
+        try:
+            self.result_cache.put(smiles, result_key, pw.get_id(), last_modified, etag, tree)
+            #The pathway graph itself, subtrees are built from it on request
+            graph_key = setting_id + ":graph"
+            graph = json.dumps({"nodes": json_retval.get('nodes', []), "links": json_retval.get('links', [])})
+            self.result_cache.put(smiles, graph_key, pw.get_id(), last_modified,
+                                  ResultCache.make_etag(smiles, graph_key, last_modified), graph)
+        except Exception as e:
+            logging.warning("Could not cache result: {}".format(e))
+
+        yield "etag", {"etag": etag}
+        yield "result", tree
+
+    def poll_pathway(self, ep, pw, deadline=None, cancelled=None):
+        """
+        Polls a pathway until it completed, yielding ("progress", dict) for every poll.
+        Returns the tree of the pathway and its final json.
+        """
+        seen_smiles = set()
+        json_retval = pw.get_json()
+        idx = 0
+        # Nodes and links are added to the tree (and their rules resolved) as they show up between polls
+        cts_envipath_tree = self.update_tree(ep, None, json_retval)
+        yield "progress", self.progress(idx, json_retval, seen_smiles)
+        # Loop until completed flag switches
+        while json_retval['completed'] == 'false':
+            idx = idx + 1
+            print("step: " + str(idx))
+            self.wait_poll(deadline, cancelled)
             json_retval = pw.get_json()
-            idx = 0
-            # Loop until completed flag switches
-            while json_retval['completed'] == 'false':
-                # Sleep for 10 seconds
-                idx = idx + 1
-                print("step: " + str(idx))
-                time.sleep(10)
-                json_retval = pw.get_json()
-            
-            nodes = json_retval['nodes']
-            links = json_retval['links']
-            print("NumNode: " + str(len(nodes)))
-            print("NumLinks: " + str(len(links)))
-
-            headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-            for link in links:
-                if link['pseudo'] == False:
-                    idreaction = link['idreaction']
-                    response = requests.get(idreaction, headers=headers)
-                    reaction = response.text
-                                    
-                    reaction = response.json()
-                    rules = reaction['rules']
-                    rule = rules[0]['name']
-                    link["rule"] = rule         
-                    #with open("link" + ".json", "w") as text_file:
-                    #    text_file.write(json.dumps(link)) 
-
-            retval = json.dumps(json_retval)
-            envipath_data = retval.replace("'", '"')
-            #pprint(envipath_data)
-
-            #with open(smiles + ".json", "w") as text_file:
-            #    text_file.write(retval)
-
-            # Load dataframe of eawag rules called "paths"
-            df_paths = pd.read_pickle('paths.pkl')
-
-            cts_envipath_tree = Tree(nodes, links, df_paths)
-            cts_envipath_tree.build_tree()
-
-            return_val = json.dumps(cts_envipath_tree.root_node, default=lambda o: o.__dict__)
-            
+            cts_envipath_tree = self.update_tree(ep, cts_envipath_tree, json_retval)
+            yield "progress", self.progress(idx, json_retval, seen_smiles)
+
+        return cts_envipath_tree, json_retval
+
+    def wait_poll(self, deadline=None, cancelled=None):
+        """
+        Sleeps poll_interval seconds before the next poll, checking for cancellation every second.
+        """
+        for _ in range(self.poll_interval):
+            if cancelled is not None and cancelled():
+                raise PredictionCancelled("Prediction cancelled")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("Prediction did not complete in time")
+            time.sleep(1)
+
+    def discard_pathway(self, pw):
+        """
+        Forgets a pathway that did not complete, deleting it from enviPath if delete_unfinished is set.
+        """
+        pathway_id = pw.get_id()
+        self.pathway_index.remove(pathway_id)
+        if not self.delete_unfinished:
+            return
+        try:
+            pw.delete()
+            print("deleted unfinished pathway " + pathway_id)
+        except Exception as e:
+            logging.warning("Could not delete pathway {}: {}".format(pathway_id, e))
+
+    def get_cached_result(self, pw, smiles, result_key):
+        """
+        Returns the cached result if it was built from the pathway as last modified, else None.
+        """
+        try:
+            cached = self.result_cache.get(smiles, result_key)
+            if cached is not None and cached["pathway_id"] == pw.get_id() \
+                    and pw.is_completed() and cached["last_modified"] == pw.lastmodified():
+                return cached
+        except Exception as e:
+            logging.warning("Could not read cached result: {}".format(e))
+        return None
+
+    def get_envipath_result(self, smiles, gen_limit, shape="tree", depth=None, min_likelihood=None, top_k=None,
+                            max_nodes=None, score=False, summary=False, timeout=None, cancelled=None):
+        """
+        Returns the result json string and its ETag (None for errors).
+        """
+        etag = None
+        try:
+
+            events = self.iter_envipath_tree(smiles, gen_limit, shape, depth, min_likelihood, top_k, max_nodes,
+                                             score, summary, timeout, cancelled)
+            for event, data in events:
+                if event == "etag":
+                    etag = data["etag"]
+                elif event == "result":
+                    return_val = data
 
         except Exception as e:
-            msg = e.args[0]
+            msg = error_message(e)
             logging.warning(msg)
             err_msg = {"error" : msg}
             return_val = json.dumps(err_msg)
+            etag = None
 
-        finally:
-            return return_val
+        return return_val, etag
+
+    def get_subtree(self, smiles, gen_limit, node_id, depth=None, min_likelihood=None, top_k=None, max_nodes=None,
+                    score=False, summary=False):
+        """
+        Returns the subtree below a node of a finished prediction, as json string, and its ETag
+        (None for errors). The subtree is built from the cached pathway graph, without calling enviPath
+        unless rules of its reactions are missing.
+        """
+        try:
+            self.check_options("tree", depth, min_likelihood, top_k, max_nodes, score, summary)
+            setting_id = self.set_setting_id(gen_limit)
+            graph_key = setting_id + ":graph"
+            cached = self.result_cache.get(smiles, graph_key)
+            if cached is None:
+                raise ValueError("No finished pathway for {} with setting {}".format(smiles, setting_id))
+
+            graph = json.loads(cached["tree"])
+            self.resolve_rules(graph["links"])
+            cts_envipath_tree = Tree(graph["nodes"], graph["links"], self.df_paths, self.rule_index,
+                                     self.max_tree_nodes)
+            subtree_root = cts_envipath_tree.build_subtree(node_id, depth, min_likelihood, top_k, max_nodes)
+            if score:
+                cts_envipath_tree.score_paths()
+            subtree = self.dump_tree(cts_envipath_tree, subtree_root, summary)
+
+            subtree_key = self.result_key("{}:subtree:{}".format(setting_id, node_id), "tree", depth,
+                                          min_likelihood, top_k, max_nodes, score, summary)
+            return subtree, ResultCache.make_etag(smiles, subtree_key, cached["last_modified"])
+
+        except Exception as e:
+            msg = error_message(e)
+            logging.warning(msg)
+            return json.dumps({"error" : msg}), None
+
+    def get_envipath_tree(self, smiles, gen_limit):
+        return self.get_envipath_result(smiles, gen_limit)[0]
         
 if __name__ == "__main__":
-        
-    smiles = 'c1ccccc1'
-    ctsenvipath = CTSEnvipath()
-    setting_id = 'cts-d3-n64'
-    return_val = ctsenvipath.get_envipath_tree(smiles, setting_id)
-    
\ No newline at end of file
+    # Batch predictions for a file of SMILES, e.g. python cts_envipath.py compounds.txt -o results.jsonl
+    from cts_batch import main
+    raise SystemExit(main())
@@ -1,11 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
+import gzip
 import json
 import logging
 from cts_envipath import CTSEnvipath
+from cts_callbacks import CallbackDispatcher
+from cts_memory import MemoryTracker
+from envipath_tree import binary
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
 
 
 ctsenvipath = CTSEnvipath()
+callbacks = CallbackDispatcher(ctsenvipath)
+#Share of requests whose peak memory is traced, e.g. 0.05
+memory = MemoryTracker(float(os.environ.get("TRACE_MEMORY_SAMPLE", 0)))
 
 
 app = Flask(__name__)
@@ -19,6 +31,87 @@ app.config.update(
 # })
 logging.basicConfig(level=logging.DEBUG)
 
+#Content codings offered for tree responses, in order of preference
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+MIN_COMPRESS_SIZE = 1024
+
+
+def tree_response(tree_dict, etag=None):
+	"""
+	Wraps a tree json string in the {"status", "data"} envelope, or encodes
+	the bare tree in the compact binary format if the Accept header prefers it.
+	The JSON body is compressed as negotiated through Accept-Encoding, the
+	binary format is sent as is since it compresses worse than JSON. Results
+	with an ETag answer conditional GETs with 304 Not Modified.
+	"""
+	mimetype = request.accept_mimetypes.best_match(["application/json", binary.MIMETYPE], "application/json")
+	if mimetype == binary.MIMETYPE:
+		body = binary.encode_tree(json.loads(tree_dict))
+	else:
+		body = '{{"status": true, "data": {}}}'.format(tree_dict).encode()
+
+	encoding = None
+	if mimetype != binary.MIMETYPE and len(body) >= MIN_COMPRESS_SIZE:
+		encoding = request.accept_encodings.best_match(ENCODINGS)
+	#Strong validators must differ between representations of the same result
+	if etag is not None and mimetype == binary.MIMETYPE:
+		etag = "{}-bin".format(etag)
+	if etag is not None and encoding is not None:
+		etag = "{}-{}".format(etag, encoding)
+
+	if etag is not None and request.method in ("GET", "HEAD") and request.if_none_match.contains(etag):
+		response = Response(status=304)
+	else:
+		if encoding == "br":
+			body = brotli.compress(body)
+		elif encoding == "gzip":
+			body = gzip.compress(body, compresslevel=6)
+		response = Response(body, mimetype=mimetype)
+		if encoding is not None:
+			response.content_encoding = encoding
+
+	response.vary.add("Accept")
+	response.vary.add("Accept-Encoding")
+	if etag is not None:
+		response.set_etag(etag)
+		response.cache_control.no_cache = True
+	return response
+
+TREE_OPTIONS = ["depth", "min_likelihood", "top_k", "max_nodes", "score", "summary"]
+
+def query_number(args, name, convert=int, default=None):
+	"""
+	Query parameter converted with convert (int or float). Raises ValueError if it
+	does not convert, instead of silently ignoring it like args.get(type=...).
+	"""
+	value = args.get(name)
+	if value is None:
+		return default
+	try:
+		return convert(value)
+	except ValueError:
+		raise ValueError("{} must be {}, not {!r}".format(name, "an integer" if convert is int else "a number", value))
+
+def tree_options(args):
+	"""
+	Tree build options (see CTSEnvipath.iter_envipath_tree) from query parameters.
+	Raises ValueError for numbers that do not parse.
+	"""
+	return {"depth": query_number(args, "depth"), "min_likelihood": args.get("min_likelihood"),
+		"top_k": query_number(args, "top_k"), "max_nodes": query_number(args, "max_nodes"),
+		"score": args.get("score", "").lower() in ("1", "true"),
+		"summary": args.get("summary", "").lower() in ("1", "true")}
+
+def bad_request(e):
+	return jsonify({"status": False, "error": str(e)}), 400
+
+def client_disconnected():
+	"""
+	Callable telling whether the client of the current request went away, if the
+	server supports it (waitress with channel_request_lookahead), else None.
+	"""
+	return request.environ.get("waitress.client_disconnected")
+
 ###################
 # FLASK ENDPOINTS #
 ###################
@@ -35,20 +128,142 @@ def test_envipath():
 def rest_endpoints():
 	pass
 
-@app.route("/envipath/rest/run", methods=["POST"])
+@app.route("/envipath/rest/run", methods=["GET", "POST"])
 def run_envipath():
 	"""
 	Runs cts_envipath.py module for envipath predictions.
 	Calls their external API and polls status to get results.
+	If a "callback_url" is posted, returns a job id right away and
+	POSTs the result to the callback url once the pathway completes.
+	Callback urls must be http(s) urls of public hosts, or hosts listed in
+	CALLBACK_ALLOWED_HOSTS.
+	GET takes smiles and gen_limit as query parameters and supports
+	conditional requests through If-None-Match.
+	Send "Accept: application/x-cts-tree" for the binary tree encoding
+	(see envipath_tree/binary.py) instead of JSON.
+	"shape": "dag" returns deduplicated node and edge tables instead of
+	the nested tree.
+	"depth" expands the tree only that many generations below the root,
+	nodes marked "truncated" can be loaded later from /envipath/rest/subtree.
+	"min_likelihood" (e.g. "Likely"), "top_k" (children per metabolite, most
+	likely first) and "max_nodes" prune the tree before it is built.
+	"score": true adds path_likelihood, best_likelihood, generation and
+	best_generation to every metabolite of the tree.
+	"summary": true returns {"tree": tree, "summary": table} with one row
+	per unique metabolite (smiles, min_generation, best_likelihood, routes,
+	parents).
+	"timeout" (seconds) shortens the server's prediction timeout. The
+	prediction is abandoned if the client disconnects while waiting.
+	Invalid options are answered with 400 Bad Request before anything is
+	sent to enviPath.
 	"""
-	post_dict = request.get_json()
-	logging.warning("POST: {}".format(post_dict))
+	if request.method == "GET":
+		try:
+			post_dict = {"smiles": request.args["smiles"], "gen_limit": query_number(request.args, "gen_limit", default=1),
+				"shape": request.args.get("shape", "tree"), "timeout": query_number(request.args, "timeout", float)}
+			post_dict.update(tree_options(request.args))
+		except ValueError as e:
+			return bad_request(e)
+	else:
+		post_dict = request.get_json()
+	logging.warning("{}: {}".format(request.method, post_dict))
 	smiles = post_dict["smiles"]
 	gen_limit = post_dict.get("gen_limit", 1)
+	callback_url = post_dict.get("callback_url")
+	shape = post_dict.get("shape", "tree")
+	options = {k: post_dict.get(k) for k in TREE_OPTIONS}
+	options["score"] = bool(options["score"])
+	options["summary"] = bool(options["summary"])
+	timeout = post_dict.get("timeout")
+	try:
+		ctsenvipath.check_options(shape, **options, timeout=timeout)
+	except ValueError as e:
+		return bad_request(e)
+
+	if callback_url:
+		try:
+			job_id = callbacks.submit(smiles, gen_limit, callback_url, shape=shape, timeout=timeout, **options)
+		except ValueError as e:
+			return bad_request(e)
+		return jsonify({"status": True, "job_id": job_id}), 202
 
-	tree_dict = ctsenvipath.get_envipath_tree(smiles, gen_limit)
+	with memory.track("run {} {}".format(smiles, gen_limit)):
+		tree_dict, etag = ctsenvipath.get_envipath_result(smiles, gen_limit, shape, **options,
+			timeout=timeout, cancelled=client_disconnected())
+		return tree_response(tree_dict, etag)
 
-	return jsonify({"status": True, "data": json.loads(tree_dict)})
+@app.route("/envipath/rest/stream")
+def stream_envipath():
+	"""
+	Server-Sent Events version of /envipath/rest/run.
+	Streams a "progress" event for every poll of the pathway (poll count,
+	node and link counts, newly discovered metabolites) followed by a
+	"result" event with the tree, or an "error" event.
+	"""
+	smiles = request.args["smiles"]
+	shape = request.args.get("shape", "tree")
+	cancelled = client_disconnected()
+	try:
+		gen_limit = query_number(request.args, "gen_limit", default=1)
+		options = tree_options(request.args)
+		timeout = query_number(request.args, "timeout", float)
+		ctsenvipath.check_options(shape, **options, timeout=timeout)
+	except ValueError as e:
+		return bad_request(e)
+
+	def events():
+		with memory.track("stream {} {}".format(smiles, gen_limit)):
+			try:
+				for event, data in ctsenvipath.iter_envipath_tree(smiles, gen_limit, shape, **options,
+						timeout=timeout, cancelled=cancelled):
+					if event == "result":
+						#The result is already serialized, only wrap it
+						yield 'event: result\ndata: {{"status": true, "data": {}}}\n\n'.format(data)
+					else:
+						yield "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+			except Exception as e:
+				logging.warning(e)
+				yield "event: error\ndata: {}\n\n".format(json.dumps({"error": str(e)}))
+
+	headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+	return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
+@app.route("/envipath/rest/subtree")
+def subtree_envipath():
+	"""
+	Returns the subtree below a node (its enviPath id as "node") of a
+	finished prediction for smiles and gen_limit, e.g. a node marked
+	"truncated" in a /envipath/rest/run response with depth.
+	Takes the same depth and pruning parameters as /envipath/rest/run.
+	"""
+	smiles = request.args["smiles"]
+	node_id = request.args["node"]
+	try:
+		gen_limit = query_number(request.args, "gen_limit", default=1)
+		options = tree_options(request.args)
+		ctsenvipath.check_options(**options)
+	except ValueError as e:
+		return bad_request(e)
+
+	with memory.track("subtree {} {}".format(smiles, node_id)):
+		tree_dict, etag = ctsenvipath.get_subtree(smiles, gen_limit, node_id, **options)
+		return tree_response(tree_dict, etag)
+
+@app.route("/envipath/rest/memory")
+def memory_stats():
+	"""
+	Returns the peak memory of recently traced requests (see TRACE_MEMORY_SAMPLE).
+	"""
+	return jsonify({"status": True, "data": memory.stats()})
+
+@app.route("/envipath/rest/callbacks/<job_id>")
+def callback_log(job_id):
+	"""
+	Returns the delivery log of a callback job.
+	"""
+	return jsonify({"status": True, "data": callbacks.get_log(job_id)})
 
 if __name__ == "__main__":
+	callbacks.start()
+	ctsenvipath.start_rule_index_build()
 	app.run(debug=True, port=5003)
\ No newline at end of file
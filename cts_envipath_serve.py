@@ -0,0 +1,98 @@
+import os
+import sys
+import signal
+import socket
+import logging
+from waitress import serve
+
+#Production server settings
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5003))
+WORKERS = int(os.environ.get("WORKERS", 2))
+THREADS = int(os.environ.get("THREADS", 8))
+
+
+def preload():
+	"""
+	Imports the app and loads shared read-only state (rule table and index,
+	settings, logged in client, pathway index) once, before forking.
+	"""
+	import cts_envipath_flask
+	cts_envipath_flask.ctsenvipath.warm_up()
+	return cts_envipath_flask.app, cts_envipath_flask.ctsenvipath
+
+
+def warm_up_worker(app, ctsenvipath):
+	"""
+	Runs in every worker before it starts accepting connections.
+	"""
+	ctsenvipath.reset_connections()
+	#Picks up callback jobs queued by workers that went away
+	import cts_envipath_flask
+	cts_envipath_flask.callbacks.start()
+	#Builds a missing rule index while serving
+	ctsenvipath.start_rule_index_build()
+	with app.test_client() as client:
+		client.get("/envipath/test")
+
+
+def run_worker(app, ctsenvipath, sock):
+	warm_up_worker(app, ctsenvipath)
+	logging.warning("Worker {} serving with {} threads".format(os.getpid(), THREADS))
+	#Lookahead lets waitress notice clients disconnecting while a prediction runs
+	serve(app, sockets=[sock], threads=THREADS, channel_request_lookahead=5)
+
+
+def main():
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.bind((HOST, PORT))
+	sock.listen(1024)
+
+	app, ctsenvipath = preload()
+
+	if WORKERS <= 1 or not hasattr(os, "fork"):
+		run_worker(app, ctsenvipath, sock)
+		return
+
+	children = set()
+	stopping = False
+
+	def spawn():
+		pid = os.fork()
+		if pid == 0:
+			signal.signal(signal.SIGTERM, signal.SIG_DFL)
+			try:
+				run_worker(app, ctsenvipath, sock)
+			finally:
+				os._exit(0)
+		children.add(pid)
+
+	def stop(signum, frame):
+		nonlocal stopping
+		stopping = True
+		for pid in children:
+			os.kill(pid, signal.SIGTERM)
+
+	signal.signal(signal.SIGTERM, stop)
+	signal.signal(signal.SIGINT, stop)
+
+	for _ in range(WORKERS):
+		spawn()
+
+	#Restart workers that die until asked to stop
+	while children:
+		try:
+			pid, status = os.wait()
+		except ChildProcessError:
+			break
+		children.discard(pid)
+		if not stopping:
+			logging.warning("Worker {} exited with status {}, restarting".format(pid, status))
+			spawn()
+
+	sys.exit(0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,70 @@
+import time
+import random
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+
+class MemoryTracker:
+    """
+    Traces Python heap allocations (tracemalloc) while a sample of requests runs
+    and logs their peak usage. Tracing is only switched on while a sampled request
+    is in flight. tracemalloc is process wide, so the peak of a request includes
+    allocations of requests running concurrently with it.
+    """
+
+    def __init__(self, sample_rate=0.0, log_size=1000):
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        #Sampled requests in flight, and whether tracing was started by us
+        self.active = 0
+        self.started = False
+        self.baseline = 0
+
+        self.samples = deque(maxlen=log_size)
+
+    @contextmanager
+    def track(self, label):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            yield
+            return
+
+        with self.lock:
+            if self.active == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.started = True
+                tracemalloc.reset_peak()
+                self.baseline = tracemalloc.get_traced_memory()[0]
+            self.active += 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                peak = tracemalloc.get_traced_memory()[1] - self.baseline
+                self.active -= 1
+                if self.active == 0 and self.started:
+                    tracemalloc.stop()
+                    self.started = False
+            self.record(label, peak, time.time() - start)
+
+    def record(self, label, peak, duration):
+        self.samples.append({
+            "label": label,
+            "peak_bytes": peak,
+            "duration": duration,
+            "time": time.time(),
+        })
+        logging.warning("Memory {}: peak {:.1f} MiB in {:.1f} s".format(label, peak / 2**20, duration))
+
+    def stats(self):
+        samples = list(self.samples)
+        return {
+            "sample_rate": self.sample_rate,
+            "samples": len(samples),
+            "max_peak_bytes": max((s["peak_bytes"] for s in samples), default=0),
+            "recent": samples[-20:],
+        }
@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from enviPath_python.objects import Pathway
+
+# Pathways created by CTSEnvipath carry their setting name and the requested SMILES in the description
+SETTING_PATTERN = re.compile(r'using setting (\S+)(?: for (\S+))?')
+
+
+class PathwayIndex:
+    """
+    Index of the pathways already present in a package, keyed by (SMILES, setting name),
+    so a prediction can be reused instead of repeated. Pathways are indexed under the SMILES
+    they were requested for and the SMILES of their root node, which enviPath may write differently.
+    New pathways of the package are picked up in the background, see start().
+    """
+
+    def __init__(self, refresh_interval=300, max_fetch=50, scheduler=None):
+        self.refresh_interval = refresh_interval
+        #Pathways are fetched as low priority 'enrich' requests of the RequestScheduler
+        self.scheduler = scheduler
+        self.max_fetch = max_fetch
+
+        #(smiles, setting name) -> list of (lastModified, pathway id)
+        self.entries = dict()
+        #pathway ids already looked at
+        self.indexed = set()
+        self.lock = threading.Lock()
+        #Held while a refresh runs, there is never more than one at a time
+        self.refresh_lock = threading.Lock()
+        #Process the refresh thread runs in
+        self.pid = None
+
+    @staticmethod
+    def description(setting_name, smiles):
+        return 'A pathway created via REST using setting {} for {}'.format(setting_name, smiles)
+
+    def add(self, smiles, setting_name, pathway_id, last_modified=0):
+        with self.lock:
+            self.indexed.add(pathway_id)
+            lst_entries = self.entries.setdefault((smiles, setting_name), list())
+            if (last_modified, pathway_id) not in lst_entries:
+                lst_entries.append((last_modified, pathway_id))
+                lst_entries.sort(reverse=True)
+
+    def add_json(self, json_pathway):
+        """
+        Indexes a pathway from its plain enviPath JSON.
+        Pathways without a recognizable setting are only marked as seen.
+        """
+        pathway_id = json_pathway['id']
+        match = SETTING_PATTERN.search(json_pathway.get('description') or '')
+        roots = [node['smiles'] for node in json_pathway.get('nodes', []) if node.get('depth') == 0]
+        if match is None or (len(roots) == 0 and match.group(2) is None):
+            with self.lock:
+                self.indexed.add(pathway_id)
+            return
+        last_modified = json_pathway.get('lastModified') or 0
+        for smiles in ({match.group(2)} | set(roots[:1])) - {None}:
+            self.add(smiles, match.group(1), pathway_id, last_modified)
+
+    def remove(self, pathway_id):
+        with self.lock:
+            for lst_entries in self.entries.values():
+                lst_entries[:] = [entry for entry in lst_entries if entry[1] != pathway_id]
+
+    def start(self, get_package):
+        """
+        Starts a thread in the current process that keeps refreshing the index, if not running yet.
+        :param get_package: Callable returning the Package, called for every refresh.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self.run, args=(get_package,), name="pathway-index", daemon=True).start()
+
+    def run(self, get_package):
+        while True:
+            try:
+                more = self.refresh(get_package())
+            except Exception as e:
+                logging.warning("Could not refresh pathway index: {}".format(e))
+                more = False
+            # A large package is picked up batch by batch
+            time.sleep(1 if more else self.refresh_interval)
+
+    def refresh(self, package):
+        """
+        Indexes pathways of the package not seen before, at most max_fetch per call.
+        Returns True if pathways are left for the next call. Returns right away
+        if another thread is refreshing already.
+        """
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            with self.scheduler.category('enrich') if self.scheduler is not None else nullcontext():
+                return self.fetch_new(package)
+        finally:
+            self.refresh_lock.release()
+
+    def fetch_new(self, package):
+        fetched = 0
+        for pathway in package.get_pathways():
+            if pathway.get_id() in self.indexed:
+                continue
+            if fetched >= self.max_fetch:
+                return True
+            fetched = fetched + 1
+            try:
+                self.add_json(pathway.get_json())
+            except Exception as e:
+                logging.warning("Could not index pathway {}: {}".format(pathway.get_id(), e))
+                with self.lock:
+                    self.indexed.add(pathway.get_id())
+        return False
+
+    def find(self, package, smiles, setting_name):
+        """
+        Returns the most recently modified pathway for smiles and setting that has not
+        failed and is up to date, or None. Pathways still being predicted are returned too,
+        so the caller can wait for them instead of predicting again.
+        Only looks at the index, which is refreshed in the background.
+        """
+        with self.lock:
+            candidates = [pathway_id for _, pathway_id in self.entries.get((smiles, setting_name), list())]
+
+        for pathway_id in candidates:
+            pw = Pathway(package.requester, id=pathway_id)
+            try:
+                failed = pw.has_failed()
+            except Exception as e:
+                # Deleted or no longer readable
+                logging.warning("Dropping pathway {} from index: {}".format(pathway_id, e))
+                self.remove(pathway_id)
+                continue
+            if failed:
+                continue
+
+            try:
+                # Outdated once the package's rules changed after the prediction
+                if pw.is_up_to_date() in (False, 'false'):
+                    continue
+            except ValueError:
+                pass
+            return pw
+
+        return None
@@ -0,0 +1,153 @@
+"""
+Pre-computes trees for a list of SMILES into the service's result cache, e.g. nightly
+for the most queried parent compounds:
+
+    python cts_prewarm.py hot_compounds.csv --workers 4
+
+The input is a TXT file with one SMILES per line, or a CSV with "smiles" and optionally
+"gen_limit" columns. Without a gen_limit column every SMILES is warmed for --gen-limit.
+Finished entries are appended to the --progress file; a restarted run skips those done
+within --max-age hours, so an interrupted run resumes while the next night's run starts over.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cts_envipath import CTSEnvipath, error_message
+from cts_result_cache import ResultCache
+
+
+class ProgressLog:
+    """
+    Append-only JSONL log of finished jobs, used to resume a run.
+    """
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.lock = threading.Lock()
+        #key -> time the job succeeded
+        self.done = dict()
+        if os.path.exists(path):
+            min_time = time.time() - max_age if max_age is not None else 0
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Line cut off by an interrupted run
+                        continue
+                    if entry.get("status") == "ok" and entry.get("time", 0) >= min_time:
+                        self.done[entry["key"]] = entry["time"]
+
+    def is_done(self, key):
+        return key in self.done
+
+    def record(self, key, status, **fields):
+        entry = dict(fields, key=key, status=status, time=time.time())
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            if status == "ok":
+                self.done[key] = entry["time"]
+
+
+def read_compounds(path, gen_limits):
+    """
+    Returns (smiles, gen_limit) pairs from a TXT or CSV file.
+    """
+    with open(path, newline="") as f:
+        lines = [line for line in f if line.strip() and not line.startswith("#")]
+
+    if lines and lines[0].split(",")[0].strip().lower() == "smiles":
+        lst_compounds = list()
+        for row in csv.DictReader(lines):
+            if row.get("gen_limit"):
+                lst_compounds.append((row["smiles"].strip(), int(row["gen_limit"])))
+            else:
+                lst_compounds.extend((row["smiles"].strip(), gen_limit) for gen_limit in gen_limits)
+        return lst_compounds
+
+    return [(line.strip(), gen_limit) for line in lines for gen_limit in gen_limits]
+
+
+def run_jobs(progress, compounds, work, workers, **options):
+    """
+    Runs work(smiles, gen_limit) -> (status, fields) on workers threads for every compound
+    not done yet in the progress log, and records the results there. Jobs are keyed by
+    SMILES, gen_limit and the values of options, which are recorded with each result too.
+    Returns the number of jobs run and the number that failed.
+    """
+    lst_jobs = list()
+    seen = set()
+    for smiles, gen_limit in compounds:
+        key = "\t".join([smiles, str(gen_limit)] + [str(value) for value in options.values()])
+        if not progress.is_done(key) and key not in seen:
+            seen.add(key)
+            lst_jobs.append((key, smiles, gen_limit))
+    print("{} to run, {} already done".format(len(lst_jobs), len(progress.done)))
+
+    def timed_work(smiles, gen_limit):
+        start = time.time()
+        status, fields = work(smiles, gen_limit)
+        return status, fields, time.time() - start
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(timed_work, smiles, gen_limit): (key, smiles, gen_limit)
+                   for key, smiles, gen_limit in lst_jobs}
+        for idx, future in enumerate(as_completed(futures)):
+            key, smiles, gen_limit = futures[future]
+            try:
+                status, fields, duration = future.result()
+            except Exception as e:
+                status, fields, duration = "error", {"error": error_message(e)}, 0
+            #Fields of the result win over options of the same name, e.g. the summary table
+            progress.record(key, status, smiles=smiles, gen_limit=gen_limit, **dict(options, **fields))
+            if status != "ok":
+                failed = failed + 1
+                logging.warning("{} (gen_limit {}) failed: {}".format(smiles, gen_limit, fields["error"]))
+            print("[{}/{}] {} {} {} ({:.1f} s)".format(idx + 1, len(lst_jobs), status, gen_limit, smiles, duration))
+
+    return len(lst_jobs), failed
+
+
+def warm(ctsenvipath, smiles, gen_limit, shape):
+    start = time.time()
+    result, etag = ctsenvipath.get_envipath_result(smiles, gen_limit, shape)
+    if etag is None:
+        return "error", {"error": json.loads(result).get("error"), "duration": time.time() - start}
+    return "ok", {"etag": etag, "duration": time.time() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-computes trees into the CTS enviPath result cache.")
+    parser.add_argument("compounds", help="TXT file with one SMILES per line or CSV with smiles[,gen_limit]")
+    parser.add_argument("--gen-limit", type=int, nargs="+", default=[1, 2],
+                        help="gen_limits to warm for SMILES without one (default: 1 2)")
+    parser.add_argument("--shape", default="tree", help="result shape, tree or dag")
+    parser.add_argument("--workers", type=int, default=4, help="predictions running at once")
+    parser.add_argument("--cache", default=os.environ.get("RESULT_CACHE", "results.db"), help="result cache database")
+    parser.add_argument("--progress", default="prewarm_progress.jsonl", help="progress log to resume from")
+    parser.add_argument("--max-age", type=float, default=20,
+                        help="hours after which entries of the progress log are warmed again")
+    args = parser.parse_args()
+
+    ctsenvipath = CTSEnvipath()
+    ctsenvipath.result_cache = ResultCache(args.cache)
+    ctsenvipath.warm_up()
+
+    progress = ProgressLog(args.progress, args.max_age * 3600)
+    compounds = read_compounds(args.compounds, args.gen_limit)
+    num_jobs, failed = run_jobs(progress, compounds, lambda smiles, gen_limit: warm(
+        ctsenvipath, smiles, gen_limit, args.shape), args.workers, shape=args.shape)
+
+    print("warmed {}, failed {}".format(num_jobs - failed, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
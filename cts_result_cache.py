@@ -0,0 +1,68 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class SQLiteStore:
+    """
+    Tables in a SQLite file shared by the service's worker processes, created on first use.
+    """
+
+    SCHEMA = ()
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        #One connection per thread and process, never inherited across fork
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+
+class ResultCache(SQLiteStore):
+    """
+    SQLite cache of finished trees keyed by (SMILES, setting name).
+    Shared by the service's worker processes and offline tools writing into it.
+    """
+
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS results ("
+              "smiles TEXT NOT NULL, setting TEXT NOT NULL, pathway_id TEXT, last_modified INTEGER, "
+              "etag TEXT NOT NULL, tree TEXT NOT NULL, created REAL NOT NULL, "
+              "PRIMARY KEY (smiles, setting))",)
+
+    @staticmethod
+    def make_etag(smiles, setting_name, last_modified):
+        key = "{}\n{}\n{}".format(smiles, setting_name, last_modified)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, smiles, setting_name):
+        row = self.connection().execute(
+            "SELECT pathway_id, last_modified, etag, tree, created FROM results WHERE smiles = ? AND setting = ?",
+            (smiles, setting_name)).fetchone()
+        if row is None:
+            return None
+        return {
+            "pathway_id": row[0],
+            "last_modified": row[1],
+            "etag": row[2],
+            "tree": row[3],
+            "created": row[4],
+        }
+
+    def put(self, smiles, setting_name, pathway_id, last_modified, etag, tree):
+        conn = self.connection()
+        conn.execute("INSERT OR REPLACE INTO results "
+                     "(smiles, setting, pathway_id, last_modified, etag, tree, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (smiles, setting_name, pathway_id, last_modified, etag, tree, time.time()))
+        conn.commit()
@@ -14,24 +14,39 @@
 # CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 from requests import Session
 from requests.adapters import HTTPAdapter
 
 from enviPath_python.objects import *
 
 
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised for requests made past the deadline set with enviPathRequester.deadline().
+    """
+    pass
+
+
 class enviPath(object):
     """
     Object representing enviPath functionality.
     """
 
-    def __init__(self, base_url, proxies=None):
+    def __init__(self, base_url, proxies=None, requester=None, scheduler=None):
         """
         Constructor with instance specification.
         :param base_url: The url of the enviPath instance.
+        :param requester: Optional requester to use instead of a new enviPathRequester, e.g. a MirrorRequester.
+        :param scheduler: Optional RequestScheduler rate limiting the requests of a new enviPathRequester.
         """
         self.BASE_URL = base_url if base_url.endswith('/') else base_url + '/'
-        self.requester = enviPathRequester(proxies)
+        self.requester = requester if requester is not None else enviPathRequester(proxies, scheduler)
 
     def get_base_url(self):
         return self.BASE_URL
@@ -204,16 +219,90 @@ class enviPathRequester(object):
         Endpoint.RELATIVEREASONING: RelativeReasoning,
     }
 
-    def __init__(self, proxies=None):
+    # Attempts of a request answered with 429 Too Many Requests, if a scheduler is set
+    throttled_retries = 3
+
+    # Default (connect, read) timeout in seconds of every request
+    timeout = (10, 60)
+
+    def __init__(self, proxies=None, scheduler=None):
         """
         Setup session for cookies as well as avoiding unnecessary ssl-handshakes.
+        :param scheduler: Optional RequestScheduler shared by all requesters talking to the instance.
         """
+        self.scheduler = scheduler
+        self._deadlines = threading.local()
+        # (type, id) -> live enviPathObject, see get_instance
+        self._instances = weakref.WeakValueDictionary()
+        self._instances_lock = threading.Lock()
         self.session = Session()
         self.session.mount('http://', HTTPAdapter())
         self.session.mount('https://', HTTPAdapter())
         if proxies:
             self.session.proxies = proxies
 
+    def get_instance(self, cls, envipath_id):
+        """
+        Identity map of the objects created with this requester: returns the live instance of cls
+        for envipath_id, or registers a new, not yet initialized one. Instances are only weakly
+        referenced and dropped once no longer used elsewhere.
+        :param cls: The enviPathObject subclass.
+        :param envipath_id: The id of the object.
+        :return: The instance.
+        """
+        with self._instances_lock:
+            obj = self._instances.get((cls, envipath_id))
+            if obj is None:
+                obj = object.__new__(cls)
+                self._instances[(cls, envipath_id)] = obj
+            return obj
+
+    def forget_instance(self, cls, envipath_id):
+        """
+        Removes an object from the identity map, e.g. after it was deleted.
+        """
+        with self._instances_lock:
+            self._instances.pop((cls, envipath_id), None)
+
+    def prefetch(self, objects, max_workers=8):
+        """
+        Loads many objects concurrently over the pooled session and populates them in place,
+        so that following getters (e.g. get_smirks(), get_depth()) need no further requests.
+        Objects already loaded and duplicates are skipped. The deadline of the calling thread applies.
+        If loading some objects failed, the others are populated before the first error is raised.
+        :param objects: Iterable of enviPathObjects.
+        :param max_workers: Maximum number of requests running at once.
+        :return: Number of objects loaded.
+        """
+        pending = list()
+        seen = set()
+        for obj in objects:
+            if not obj.loaded and id(obj) not in seen:
+                seen.add(id(obj))
+                pending.append(obj)
+        if len(pending) == 0:
+            return 0
+
+        deadline = self.get_deadline()
+
+        def load(obj):
+            with self.deadline(deadline):
+                try:
+                    return obj._load(), None
+                except Exception as e:
+                    return None, e
+
+        error = None
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            for obj, (obj_fields, e) in zip(pending, executor.map(load, pending)):
+                if e is not None:
+                    error = error or e
+                elif not obj.loaded:
+                    obj._set_fields(obj_fields)
+        if error is not None:
+            raise error
+        return len(pending)
+
     def get_request(self, url, params=None, payload=None, **kwargs):
         """
         Convenient method to perform GET request to given url with optional query parameters and data.
@@ -251,19 +340,73 @@ class enviPathRequester(object):
         :param url: url for request.
         :param params: parameters to send.
         :param payload: data to send.
+        :param category: Optional scheduler category ('submit', 'poll', 'enrich'), derived from method and url if omitted.
         :return: response object.
         """
-        response = self.session.request(method, url, params=params, data=payload, headers=self.header, **kwargs)
+        category = kwargs.pop('category', None)
+        kwargs['timeout'] = self.get_timeout(kwargs.get('timeout', self.timeout))
+        if self.scheduler is None:
+            response = self.session.request(method, url, params=params, data=payload, headers=self.header, **kwargs)
+            response.raise_for_status()
+            return response
+
+        category = self.scheduler.get_category(method, url, category)
+        for attempt in range(self.throttled_retries):
+            self.scheduler.acquire(category, self.get_deadline())
+            kwargs['timeout'] = self.get_timeout(kwargs['timeout'])
+            response = self.session.request(method, url, params=params, data=payload, headers=self.header, **kwargs)
+            if response.status_code != 429:
+                break
+            # Throttled, hold back all requests before trying again
+            retry_after = response.headers.get('Retry-After', '')
+            self.scheduler.pause(int(retry_after) if retry_after.isdigit() else 2 ** (attempt + 1))
         response.raise_for_status()
         return response
 
-    def get_json(self, envipath_id: str):
+    @contextmanager
+    def deadline(self, deadline):
+        """
+        Requests of the current thread within the block raise DeadlineExceeded once deadline
+        (a time.monotonic() value) has passed, and their timeouts are cut to the time left.
+        Nested blocks keep the earlier deadline.
+        :param deadline: The deadline, None for no (further) limit.
+        """
+        previous = self.get_deadline()
+        if deadline is None or (previous is not None and previous < deadline):
+            deadline = previous
+        self._deadlines.deadline = deadline
+        try:
+            yield
+        finally:
+            self._deadlines.deadline = previous
+
+    def get_deadline(self):
+        return getattr(self._deadlines, 'deadline', None)
+
+    def get_timeout(self, timeout):
+        """
+        Cuts a requests timeout (seconds or (connect, read) tuple) to the time left until the deadline.
+        """
+        deadline = self.get_deadline()
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+    def get_json(self, envipath_id: str, category=None):
         """
         TODO
         :param envipath_id:
+        :param category: Optional scheduler category of the request.
         :return:
         """
-        return self.get_request(envipath_id).json()
+        return self.get_request(envipath_id, category=category).json()
 
     def login(self, url, username, password):
         """
@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import threading
+
+from enviPath_python.enums import Endpoint
+from enviPath_python.enviPath import enviPath, enviPathRequester
+from enviPath_python.objects import Package
+
+
+class PackageMirror(object):
+    """
+    Local SQLite store holding the plain JSON of every compound, structure, reaction, rule and pathway
+    of one or more enviPath packages. Objects are keyed by their enviPath id so that the MirrorRequester
+    can answer the same urls the remote instance would.
+    """
+
+    RULE_IDENTIFIERS = (
+        Endpoint.SIMPLERULE.value,
+        Endpoint.SEQUENTIALCOMPOSITERULE.value,
+        Endpoint.PARALLELCOMPOSITERULE.value,
+    )
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS objects (
+            id TEXT PRIMARY KEY,
+            package TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            name TEXT,
+            smiles TEXT,
+            json TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_objects_listing ON objects (package, identifier)",
+        "CREATE INDEX IF NOT EXISTS idx_objects_smiles ON objects (smiles)",
+    )
+
+    def __init__(self, path: str):
+        """
+        Opens (and creates if necessary) the store.
+        :param path: Path of the SQLite database file.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def store(self, package_id: str, identifier: str, obj: dict) -> None:
+        """
+        Inserts or replaces a single object.
+        :param package_id: The id of the package the object belongs to.
+        :param identifier: The endpoint value of the object, e.g. 'compound' or 'simple-rule'.
+        :param obj: The plain JSON of the object as returned by the API.
+        :return: None
+        """
+        name = obj.get('pathwayName', obj.get('name'))
+        smiles = obj.get('smiles')
+        self.conn.execute(
+            "INSERT OR REPLACE INTO objects (id, package, identifier, name, smiles, json) VALUES (?, ?, ?, ?, ?, ?)",
+            (obj['id'], package_id, identifier, name, smiles, json.dumps(obj)))
+
+    def sync(self, package: Package) -> int:
+        """
+        Mirrors a package by walking its compound, reaction, rule and pathway listings and fetching the full
+        JSON of every listed object (and every structure of each compound).
+        :param package: The Package to mirror.
+        :return: Number of objects stored.
+        """
+        requester = package.requester
+        package_id = package.get_id()
+        self.store(package_id, Endpoint.PACKAGE.value, requester.get_json(package_id))
+        count = 1
+
+        for endpoint in (Endpoint.COMPOUND, Endpoint.REACTION, Endpoint.RULE, Endpoint.PATHWAY):
+            listing = requester.get_request('{}/{}'.format(package_id, endpoint.value)).json()
+            for entry in listing.get(endpoint.value, []):
+                obj = requester.get_json(entry['id'])
+                self.store(package_id, entry.get('identifier', endpoint.value), obj)
+                count += 1
+
+                if endpoint == Endpoint.COMPOUND:
+                    for structure in obj.get('structures', []):
+                        self.store(package_id, Endpoint.COMPOUNDSTRUCTURE.value,
+                                   requester.get_json(structure['id']))
+                        count += 1
+
+        self.conn.commit()
+        return count
+
+    def sync_from_export(self, package_id: str, export: dict) -> int:
+        """
+        Mirrors a package from the output of Package.export_as_json(). Every nested object carrying an 'id' and
+        a known 'identifier' is stored.
+        :param package_id: The id of the exported package.
+        :param export: The exported package as dictionary.
+        :return: Number of objects stored.
+        """
+        known = {e.value for e in Endpoint}
+        found = dict()
+        stack = [export]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, dict):
+                if 'id' in current and current.get('identifier') in known:
+                    # Objects are also referenced as short summaries, keep the most complete occurrence
+                    if current['id'] not in found or len(current) > len(found[current['id']]):
+                        found[current['id']] = current
+                stack.extend(current.values())
+            elif isinstance(current, list):
+                stack.extend(current)
+
+        for obj in found.values():
+            self.store(package_id, obj['identifier'], obj)
+        self.conn.commit()
+        return len(found)
+
+
+class MirrorResponse(object):
+    """
+    Minimal stand-in for requests.Response as consumed by the enviPath objects.
+    """
+
+    def __init__(self, url: str, text: str):
+        self.url = url
+        self.text = text
+        self.content = text.encode()
+        self.status_code = 200
+        self.headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+class MirrorRequester(enviPathRequester):
+    """
+    Read-only enviPathRequester answering GET requests from a PackageMirror database instead of the network.
+    Can be passed to any enviPath object, e.g. Package(MirrorRequester('eawag.db'), id=...).get_reactions().
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of a database previously filled by PackageMirror.
+        """
+        if not os.path.exists(path):
+            raise ValueError("Mirror database {} does not exist!".format(path))
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, url, params=None, payload=None, **kwargs):
+        if method != 'GET':
+            raise ValueError("MirrorRequester is read-only, {} {} not supported".format(method, url))
+
+        url = url.rstrip('/')
+        conn = self._connection()
+        row = conn.execute("SELECT json FROM objects WHERE id = ?", (url,)).fetchone()
+        if row is not None:
+            return MirrorResponse(url, row[0])
+
+        # Listings, e.g. <package>/compound or <package>/rule
+        package_id, _, endpoint = url.rpartition('/')
+        if endpoint == Endpoint.RULE.value:
+            identifiers = PackageMirror.RULE_IDENTIFIERS
+        else:
+            identifiers = (endpoint,)
+        rows = conn.execute(
+            "SELECT id, name, identifier FROM objects WHERE package = ? AND identifier IN ({})".format(
+                ','.join('?' * len(identifiers))), (package_id,) + identifiers).fetchall()
+        if rows or conn.execute("SELECT 1 FROM objects WHERE id = ?", (package_id,)).fetchone():
+            listing = {endpoint: [{'id': r[0], 'name': r[1], 'identifier': r[2]} for r in rows]}
+            return MirrorResponse(url, json.dumps(listing))
+
+        raise ValueError("{} is not present in mirror {}".format(url, self.path))
+
+    def login(self, url, username, password):
+        # Nothing to authenticate against
+        pass
+
+    def logout(self, url):
+        pass
+
+
+if __name__ == "__main__":
+    # Mirrors the package CTSEnvipath predicts in (or the given one), e.g.
+    #   python -m enviPath_python.mirror -o mirror.db
+    # Point the service at the result with ENVIPATH_MIRROR=mirror.db to look reactions up locally.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mirrors an enviPath package into a local SQLite database.")
+    parser.add_argument("package", nargs="?", help="id of the package, defaults to CTSEnvipath's package")
+    parser.add_argument("-o", "--output", default=os.environ.get('ENVIPATH_MIRROR', 'mirror.db'),
+                        help="database to write to")
+    args = parser.parse_args()
+
+    package_id = args.package
+    if package_id is None:
+        from cts_envipath import CTSEnvipath
+        package_id = CTSEnvipath().package_id
+    instance_host = package_id[:package_id.index('package/')]
+
+    eP = enviPath(instance_host)
+    eP.login(os.environ['USERNAME'], os.environ['PASSWORD'])
+    mirror = PackageMirror(args.output)
+    print("Stored {} objects".format(mirror.sync(eP.get_package(package_id))))
+    mirror.close()
@@ -28,6 +28,18 @@ class enviPathObject(ABC):
     Base class for an enviPath object.
     """
 
+    # Whether instances are shared through the requester's identity map, see __new__
+    identity_mapped = True
+
+    def __new__(cls, requester=None, *args, **kwargs):
+        """
+        Returns the live instance of the same type and id if the requester keeps an identity map,
+        so that all references to an object share its loaded state (see enviPathRequester.get_instance).
+        """
+        if cls.identity_mapped and kwargs.get('id') is not None and hasattr(requester, 'get_instance'):
+            return requester.get_instance(cls, kwargs['id'])
+        return super().__new__(cls)
+
     def __init__(self, requester, *args, **kwargs):
         """
         Constructor for any instance derived from enviPathObject.
@@ -35,6 +47,11 @@ class enviPathObject(ABC):
         :param args: additional positional arguments.
         :param kwargs: additional named arguments. 'name' and 'id' are mandatory.
         """
+        if 'requester' in self.__dict__ and getattr(self, 'id', None) == kwargs['id']:
+            # Live instance from the identity map, keep what was loaded already
+            if 'name' in kwargs and not hasattr(self, 'name'):
+                self.name = kwargs['name']
+            return
         self.requester = requester
         # Make name optional to allow object creation with id only
         if 'name' in kwargs:
@@ -74,10 +91,7 @@ class enviPathObject(ABC):
         :return: The value of the field.
         """
         if not self.loaded and not hasattr(self, field):
-            obj_fields = self._load()
-            for k, v in obj_fields.items():
-                setattr(self, k, v)
-                self.loaded = True
+            self._set_fields(self._load())
 
         if not hasattr(self, field):
             raise ValueError('{} has no property {}'.format(self.get_type(), field))
@@ -101,6 +115,15 @@ class enviPathObject(ABC):
     def get_description(self):
         return self._get('description')
 
+    def _set_fields(self, obj_fields):
+        """
+        Populates the object from its fetched JSON.
+        :param obj_fields: The JSON as returned by _load().
+        """
+        for k, v in obj_fields.items():
+            setattr(self, k, v)
+            self.loaded = True
+
     def _load(self):
         """
         Fetches data from the enviPath instance via the enviPathRequester provided at objects creation.
@@ -131,9 +154,11 @@ class enviPathObject(ABC):
         if not hasattr(self, 'id') or self.id is None:
             raise ValueError("Unable to delete object due to missing id!")
         self.requester.delete_request(self.id)
+        if hasattr(self.requester, 'forget_instance'):
+            self.requester.forget_instance(type(self), self.id)
         self.id = None
         # Removed potential cached members
-        for key in self.__dict__:
+        for key in list(self.__dict__):
             self.__delattr__(key)
 
 
@@ -936,6 +961,8 @@ class NormalizationRule(ReviewableEnviPathObject):
 
 
 class Pathway(ReviewableEnviPathObject):
+    # The status fields change while a pathway is predicted, so every instance loads its own
+    identity_mapped = False
 
     def get_nodes(self) -> List[Node]:
         return self._create_from_nested_json('nodes', Node)
@@ -0,0 +1,147 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket(object):
+    """
+    Allows rate requests per second on average, with bursts of up to burst requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Seconds until a token is available, as of the last refill.
+        """
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RequestScheduler(object):
+    """
+    Shared rate limiter for all requests to an enviPath instance.
+    Every request takes a token from the overall bucket and from the bucket of its
+    category, if that category is limited. When requests are waiting, tokens go to
+    the category with the highest priority first: prediction submissions, then
+    status polls, then enrichment lookups (reactions, rules, listings).
+    """
+
+    CATEGORIES = ['submit', 'poll', 'enrich']
+
+    def __init__(self, rate, burst=None, limits=None):
+        """
+        :param rate: Requests per second to the instance overall.
+        :param burst: Requests that may be sent at once after being idle, defaults to rate.
+        :param limits: Optional dictionary of category -> requests per second.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.buckets = {category: TokenBucket(limit) for category, limit in (limits or dict()).items()}
+        self.paused_until = 0
+
+        self.cond = threading.Condition()
+        self.waiting = list()
+        self.counter = itertools.count()
+        self.local = threading.local()
+
+    @staticmethod
+    def categorize(method, url):
+        """
+        Default category of a request: pathways POSTed to a package are prediction submissions,
+        pathways are polled while predicted, everything else (lookups, rule applications,
+        other changes) is sent to enrich results.
+        """
+        if method == 'POST' and url.rstrip('/').endswith('/pathway'):
+            return 'submit'
+        if method == 'GET' and '/pathway/' in url:
+            return 'poll'
+        return 'enrich'
+
+    @contextmanager
+    def category(self, category):
+        """
+        Sends requests of the current thread within the block as category, e.g. background refreshes as 'enrich'.
+        """
+        previous = getattr(self.local, 'category', None)
+        self.local.category = category
+        try:
+            yield
+        finally:
+            self.local.category = previous
+
+    def get_category(self, method, url, category=None):
+        if category is None:
+            category = getattr(self.local, 'category', None)
+        if category is None:
+            category = self.categorize(method, url)
+        if category not in self.CATEGORIES:
+            raise ValueError("Unknown request category {}".format(category))
+        return category
+
+    def pause(self, seconds):
+        """
+        Holds back all requests for seconds, e.g. after the instance answered 429 Too Many Requests.
+        """
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def wait_time(self, entry, now):
+        """
+        Seconds the waiting entry has to wait, or None until another request was sent.
+        """
+        bucket = self.buckets.get(entry[2])
+        if bucket is not None:
+            bucket.refill(now)
+            if bucket.wait_time() > 0:
+                return bucket.wait_time()
+
+        # Waiting requests of higher priority go first, unless their own category is exhausted
+        for other in sorted(self.waiting):
+            if other == entry:
+                break
+            other_bucket = self.buckets.get(other[2])
+            if other_bucket is not None:
+                other_bucket.refill(now)
+            if other_bucket is None or other_bucket.wait_time() == 0:
+                return None
+
+        self.bucket.refill(now)
+        return max(self.bucket.wait_time(), self.paused_until - now)
+
+    def acquire(self, category, deadline=None):
+        """
+        Blocks until a request of category may be sent.
+        :param deadline: Optional time.monotonic() value, raises TimeoutError if no token is available by then.
+        """
+        with self.cond:
+            entry = (self.CATEGORIES.index(category), next(self.counter), category)
+            self.waiting.append(entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self.wait_time(entry, now)
+                    if wait is not None and wait <= 0:
+                        break
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise TimeoutError("Deadline exceeded waiting for a {} request slot".format(category))
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    self.cond.wait(wait)
+                self.bucket.take()
+                if category in self.buckets:
+                    self.buckets[category].take()
+            finally:
+                self.waiting.remove(entry)
+                self.cond.notify_all()
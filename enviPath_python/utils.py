@@ -14,81 +14,324 @@
 # CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from collections import defaultdict
-from enviPath_python.objects import Pathway, Setting
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple, Union
+from enviPath_python.objects import Package, Pathway, Rule, Setting
+
+# Plain arrays extracted once from a pathway's JSON. Nodes are addressed by index, edges are (source, target) pairs.
+PathwayGraph = namedtuple('PathwayGraph', 'smiles, depths, pseudo, edges')
 
 
 class MultiGenUtils(object):
 
     @staticmethod
-    def evaluate(pathway: Pathway, setting: Setting):
+    def evaluate(pathways: List[Pathway], setting: Setting, package: Package, max_workers: int = 8,
+                 poll_interval: int = 10, max_wait: Optional[float] = 3600, cleanup: bool = False) -> dict:
         """
-        Takes an pathway and uses the setting to predict a pathway with the exact same root node and compares
-        the resulting pathway against the provided one.
-        :param pathway: The pathway that is tried to predict.
+        Takes pathways and uses the setting to predict pathways with the exact same root nodes and compares
+        the resulting pathways against the provided ones.
+        Predictions are submitted concurrently, all pending predictions are polled in shared rounds and the
+        finished pairs are scored in a process pool.
+        :param pathways: The pathways that are tried to predict.
         :param setting: The setting used for prediction
-        :return:
+        :param package: The package the predicted pathways are stored in.
+        :param max_workers: Number of concurrent requests and scoring processes.
+        :param poll_interval: Seconds between polling rounds.
+        :param max_wait: Seconds to poll at most, predictions still pending then count as failed. None for no limit.
+        :param cleanup: Delete the predicted pathways afterwards, failed deletions are logged.
+        :return: Dictionary with 'depths' (depth -> metrics), 'overall' metrics and 'failed' (pathway id -> error).
+        """
+        failed = dict()
+
+        def submit(reference):
+            data = MultiGenUtils.extract_graph(reference)
+            root = data.smiles[data.depths.index(0)]
+            pred = package.predict(root, name='Evaluation of {}'.format(reference.get_id()), setting=setting)
+            return data, pred
+
+        def poll(pred):
+            return pred.get_json()
+
+        def delete(pred):
+            try:
+                pred.delete()
+            except Exception as e:
+                logging.warning('Could not delete {}: {}'.format(pred.get_id(), e))
+
+        data_graphs = dict()
+        pending = dict()
+        finished = dict()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(submit, reference): reference.get_id() for reference in pathways}
+            for future in as_completed(futures):
+                try:
+                    data_graphs[futures[future]], pending[futures[future]] = future.result()
+                except Exception as e:
+                    failed[futures[future]] = str(e)
+
+            predictions = dict(pending)
+            give_up = time.monotonic() + max_wait if max_wait is not None else None
+            while pending:
+                futures = {pool.submit(poll, pred): pathway_id for pathway_id, pred in pending.items()}
+                for future in as_completed(futures):
+                    pathway_id = futures[future]
+                    try:
+                        pred_json = future.result()
+                    except Exception as e:
+                        failed[pathway_id] = str(e)
+                        del pending[pathway_id]
+                        continue
+                    if pred_json['completed'] == 'true':
+                        finished[pathway_id] = MultiGenUtils.extract_graph(pred_json)
+                        del pending[pathway_id]
+                    elif pred_json['completed'] == 'error':
+                        failed[pathway_id] = 'Prediction failed'
+                        del pending[pathway_id]
+                if pending and give_up is not None and time.monotonic() + poll_interval > give_up:
+                    for pathway_id in pending:
+                        failed[pathway_id] = 'Prediction not finished after {} seconds'.format(max_wait)
+                    pending.clear()
+                if pending:
+                    time.sleep(poll_interval)
+
+            if cleanup:
+                list(pool.map(delete, predictions.values()))
+
+        pathway_ids = list(finished.keys())
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            scores = pool.map(MultiGenUtils.compare_graphs_by_depth,
+                              [finished[pathway_id] for pathway_id in pathway_ids],
+                              [data_graphs[pathway_id] for pathway_id in pathway_ids])
+            totals = dict()
+            for by_depth in scores:
+                for depth, counts in by_depth.items():
+                    total = totals.setdefault(depth, [0.0, 0.0, 0.0, 0.0])
+                    for i in range(4):
+                        total[i] = total[i] + counts[i]
+
+        overall = [sum(counts[i] for counts in totals.values()) for i in range(4)]
+        return {
+            'depths': {depth: MultiGenUtils.precision_recall(*totals[depth]) for depth in sorted(totals)},
+            'overall': MultiGenUtils.precision_recall(*overall),
+            'evaluated': len(pathway_ids),
+            'failed': failed,
+        }
+
+    @staticmethod
+    def precision_recall(tp_pred: float, tp_data: float, fp: float, fn: float) -> dict:
+        """
+        Turns weighted counts into precision and recall.
+        :return: Dictionary holding the counts as well as 'precision' and 'recall'.
+        """
+        return {
+            'tp_pred': tp_pred,
+            'tp_data': tp_data,
+            'fp': fp,
+            'fn': fn,
+            'precision': tp_pred / (tp_pred + fp) if tp_pred + fp > 0 else 0.0,
+            'recall': tp_data / (tp_data + fn) if tp_data + fn > 0 else 0.0,
+        }
+
+    @staticmethod
+    def extract_graph(pathway: Union[Pathway, dict]) -> PathwayGraph:
+        """
+        Extracts the node and edge arrays of a pathway with a single request.
+        :param pathway: A Pathway or its already fetched JSON.
+        :return: PathwayGraph of the pathway.
         """
-        # TODO
-        pass
+        data = pathway if isinstance(pathway, dict) else pathway.get_json()
+        nodes = data['nodes']
+        smiles = [node.get('smiles') for node in nodes]
+        depths = [node.get('depth', 0) for node in nodes]
+        pseudo = [bool(node.get('pseudo', False)) for node in nodes]
+        edges = [(link['source'], link['target']) for link in data['links']]
+        return PathwayGraph(smiles, depths, pseudo, edges)
 
     @staticmethod
-    def assemble_upsream(pathway: Pathway) -> dict:
+    def assemble_upstream(graph: PathwayGraph) -> dict:
+        """
+        Maps the SMILES of every non-pseudo node to the SMILES of its direct (non-pseudo) predecessors.
+        Pseudo nodes of multi-product reactions are resolved to the real nodes feeding them.
+        :param graph: PathwayGraph of the pathway.
+        :return: Dictionary SMILES -> set of upstream SMILES.
+        """
+        incoming = defaultdict(list)
+        for source, target in graph.edges:
+            incoming[target].append(source)
+
         res = defaultdict(set)
-        for edge in pathway.get_edges():
-            res[edge.get_end_nodes].add(edge.get_start_nodes())
+        for target, sources in incoming.items():
+            if graph.pseudo[target]:
+                continue
+            stack = list(sources)
+            seen = set()
+            while stack:
+                source = stack.pop()
+                if source in seen:
+                    continue
+                seen.add(source)
+                if graph.pseudo[source]:
+                    stack.extend(incoming.get(source, ()))
+                else:
+                    res[graph.smiles[target]].add(graph.smiles[source])
         return res
 
     @staticmethod
-    def assemble_eval_weights(pathway: Pathway) -> defaultdict[set]:
-        res = defaultdict(lambda x: 1)
-        for node in pathway.get_nodes():
-            res[node] = 1 / 2 ** node.get_depth()
+    def assemble_depths(graph: PathwayGraph) -> dict:
+        """
+        Maps the SMILES of every non-pseudo node to the smallest depth it occurs at.
+        :param graph: PathwayGraph of the pathway.
+        :return: Dictionary SMILES -> depth.
+        """
+        res = dict()
+        for smiles, depth, pseudo in zip(graph.smiles, graph.depths, graph.pseudo):
+            if not pseudo and depth < res.get(smiles, depth + 1):
+                res[smiles] = depth
         return res
 
     @staticmethod
-    def compare_pathways(pred: Pathway, data: Pathway):
-        correct_ndoes = set()
-        incorrect_nodes = set()
-        correct_edges = set()
-        incorrect_edges = set()
-
-        pred_upstream = MultiGenUtils.assemble_upsream(pred)
-        pred_eval_weights = MultiGenUtils.assemble_eval_weights(pred)
-        data_upstream = MultiGenUtils.assemble_upsream(data)
-        data_eval_weights = MultiGenUtils.assemble_eval_weights(data)
-
-        tp_pred = 0.0
-        tp_data = 0.0
-        fp = 0.0
-        fn = 0.0
-
-        for node, outgoing_nodes in data_upstream.items():
-            if node in pred_upstream:
-                if node.get_depth() == 1:
-                    # No upstream nodes available as this is the root
-                    continue
-                else:
-                    if data_upstream[node].intersection(pred_upstream[node]):
-                        correct_ndoes.add(node)
-                        for edge in data.get_edges():
-                            if node in edge.get_end_nodes:
-                                correct_edges.add(edge)
-
-                        tp_pred = tp_pred + pred_eval_weights[node]
-                    else:  # No overlap
-                        # TODO duplicate
-                        fn = fn + pred_eval_weights[node]
-                        incorrect_nodes.add(node)
-                        for edge in data.get_edges():
-                            if node in edge.get_end_nodes:
-                                incorrect_edges.add(edge)
+    def assemble_eval_weights(graph: PathwayGraph) -> dict:
+        """
+        Weights every node by 1 / 2^depth, using the smallest depth a SMILES occurs at.
+        :param graph: PathwayGraph of the pathway.
+        :return: Dictionary SMILES -> weight.
+        """
+        return {smiles: 1 / 2 ** depth for smiles, depth in MultiGenUtils.assemble_depths(graph).items()}
+
+    @staticmethod
+    def compare_graphs_by_depth(pred: PathwayGraph, data: PathwayGraph) -> dict:
+        """
+        Compares a predicted pathway against a reference one. A node is correct if it is present in both and
+        shares at least one upstream node. Root nodes have no upstream nodes and are not scored.
+        Reference nodes are accounted at their reference depth, false positives at their predicted depth.
+        :param pred: PathwayGraph of the predicted pathway.
+        :param data: PathwayGraph of the reference pathway.
+        :return: Dictionary depth -> weighted [tp_pred, tp_data, fp, fn].
+        """
+        pred_upstream = MultiGenUtils.assemble_upstream(pred)
+        pred_depths = MultiGenUtils.assemble_depths(pred)
+        data_upstream = MultiGenUtils.assemble_upstream(data)
+        data_depths = MultiGenUtils.assemble_depths(data)
+
+        correct_nodes = set()
+        res = dict()
+
+        for node, upstream in data_upstream.items():
+            depth = data_depths[node]
+            counts = res.setdefault(depth, [0.0, 0.0, 0.0, 0.0])
+            if node in pred_upstream and upstream.intersection(pred_upstream[node]):
+                correct_nodes.add(node)
+                counts[0] = counts[0] + 1 / 2 ** pred_depths[node]
+                counts[1] = counts[1] + 1 / 2 ** depth
             else:
-                # TODO duplicate
-                fn = fn + pred_eval_weights[node]
-                incorrect_nodes.add(node)
-                for edge in data.get_edges():
-                    if node in edge.get_end_nodes:
-                        incorrect_edges.add(edge)
+                counts[3] = counts[3] + 1 / 2 ** depth
+
+        for node in pred_upstream:
+            if node not in correct_nodes:
+                depth = pred_depths[node]
+                counts = res.setdefault(depth, [0.0, 0.0, 0.0, 0.0])
+                counts[2] = counts[2] + 1 / 2 ** depth
 
+        return res
+
+    @staticmethod
+    def compare_graphs(pred: PathwayGraph, data: PathwayGraph) -> Tuple[float, float, float, float]:
+        """
+        Compares a predicted pathway against a reference one, see compare_graphs_by_depth().
+        :param pred: PathwayGraph of the predicted pathway.
+        :param data: PathwayGraph of the reference pathway.
+        :return: Weighted (tp_pred, tp_data, fp, fn).
+        """
+        by_depth = MultiGenUtils.compare_graphs_by_depth(pred, data)
+        tp_pred, tp_data, fp, fn = (sum(counts[i] for counts in by_depth.values()) for i in range(4))
         return tp_pred, tp_data, fp, fn
+
+    @staticmethod
+    def compare_pathways(pred: Pathway, data: Pathway) -> Tuple[float, float, float, float]:
+        """
+        Compares a predicted pathway against a reference one, fetching each pathway exactly once.
+        :param pred: The predicted pathway.
+        :param data: The reference pathway.
+        :return: Weighted (tp_pred, tp_data, fp, fn).
+        """
+        return MultiGenUtils.compare_graphs(MultiGenUtils.extract_graph(pred), MultiGenUtils.extract_graph(data))
+
+
+class RuleApplicationCache(object):
+    """
+    Persistent SQLite cache of rule application results keyed by (rule id, SMILES).
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the SQLite database file, ':memory:' for a non-persistent cache.
+        """
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS applications "
+                          "(rule TEXT NOT NULL, smiles TEXT NOT NULL, products TEXT NOT NULL, "
+                          "PRIMARY KEY (rule, smiles))")
+        self.conn.commit()
+
+    def get(self, rule_id: str, smiles: str) -> Optional[List[str]]:
+        with self.lock:
+            row = self.conn.execute("SELECT products FROM applications WHERE rule = ? AND smiles = ?",
+                                    (rule_id, smiles)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, rule_id: str, smiles: str, products: List[str]) -> None:
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO applications (rule, smiles, products) VALUES (?, ?, ?)",
+                              (rule_id, smiles, json.dumps(products)))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class RuleUtils(object):
+
+    @staticmethod
+    def apply_rules(rules: List[Rule], smiles: List[str], cache: RuleApplicationCache = None,
+                    max_workers: int = 8) -> List[List[List[str]]]:
+        """
+        Applies every rule to every SMILES. Distinct (rule, SMILES) pairs missing from the cache are sent
+        concurrently with at most max_workers requests in flight.
+        :param rules: The rules to apply.
+        :param smiles: The SMILES to apply the rules to.
+        :param cache: Optional cache consulted before and filled after each request.
+        :param max_workers: Maximum number of concurrent requests.
+        :return: Matrix where result[i][j] holds the products of rules[i] applied to smiles[j].
+        """
+        results = dict()
+        todo = dict()
+        for rule in rules:
+            for smi in smiles:
+                key = (rule.get_id(), smi)
+                if key in results or key in todo:
+                    continue
+                cached = cache.get(*key) if cache is not None else None
+                if cached is not None:
+                    results[key] = cached
+                else:
+                    todo[key] = rule
+
+        def apply(key):
+            products = todo[key].apply_to_smiles(key[1])
+            if cache is not None:
+                cache.put(key[0], key[1], products)
+            return key, products
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for key, products in pool.map(apply, list(todo.keys())):
+                    results[key] = products
+
+        return [[results[(rule.get_id(), smi)] for smi in smiles] for rule in rules]
@@ -0,0 +1,200 @@
+import struct
+from io import BytesIO
+
+#Compact binary encoding of a metabolite tree.
+#
+#Layout (little endian):
+#   magic "CTSB", u8 version
+#   u32 string count, then per string: u32 byte length + utf-8 bytes
+#   u32 shape count, then per shape: u16 key count + u32 string id per key
+#   node records in pre-order, per node: u32 shape id, one value per key, u32 child count
+#
+#Values are a tag byte followed by the payload:
+#   0 None, 1 False, 2 True, 3 i64, 4 f64, 5 u32 string id, 6 u32 length + values, 7 u32 length + (u32 key id, value)
+#
+#Every string (values, keys) is stored once in the string table. A shape is the key list of a node record,
+#ending in "metabolites" (which has no value of its own) if the node has that key.
+
+MAGIC = b'CTSB'
+VERSION = 1
+MIMETYPE = 'application/x-cts-tree'
+
+NONE, FALSE, TRUE, INT, FLOAT, STRING, LIST, DICT = range(8)
+
+
+def node_fields(node):
+    fields = node if isinstance(node, dict) else node.__dict__
+    return [(k, v) for k, v in fields.items() if k != "metabolites"], fields.get("metabolites")
+
+
+class TreeEncoder:
+
+    def __init__(self):
+        self.strings = dict()
+        self.shapes = dict()
+        self.records = BytesIO()
+
+    def intern(self, s):
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings[s] = idx
+        return idx
+
+    def write_value(self, out, value):
+        if value is None:
+            out.write(b'\x00')
+        elif value is False:
+            out.write(b'\x01')
+        elif value is True:
+            out.write(b'\x02')
+        elif isinstance(value, int):
+            out.write(struct.pack('<Bq', INT, value))
+        elif isinstance(value, float):
+            out.write(struct.pack('<Bd', FLOAT, value))
+        elif isinstance(value, str):
+            out.write(struct.pack('<BI', STRING, self.intern(value)))
+        elif isinstance(value, (list, tuple)):
+            out.write(struct.pack('<BI', LIST, len(value)))
+            for item in value:
+                self.write_value(out, item)
+        elif isinstance(value, dict):
+            out.write(struct.pack('<BI', DICT, len(value)))
+            for k, v in value.items():
+                out.write(struct.pack('<I', self.intern(str(k))))
+                self.write_value(out, v)
+        else:
+            #e.g. numpy scalars coming from the rule dataframe
+            self.write_value(out, value.item() if hasattr(value, "item") else str(value))
+
+    def write_node(self, node):
+        out = self.records
+        #Iterative pre-order walk, deep trees must not hit the recursion limit
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            fields, children = node_fields(current)
+            shape = tuple(k for k, _ in fields)
+            if children is not None:
+                shape = shape + ("metabolites",)
+            else:
+                children = list()
+            shape_id = self.shapes.get(shape)
+            if shape_id is None:
+                shape_id = len(self.shapes)
+                self.shapes[shape] = shape_id
+                for k in shape:
+                    self.intern(k)
+            out.write(struct.pack('<I', shape_id))
+            for _, v in fields:
+                self.write_value(out, v)
+            out.write(struct.pack('<I', len(children)))
+            stack.extend(reversed(children))
+
+    def getvalue(self):
+        out = BytesIO()
+        out.write(MAGIC)
+        out.write(struct.pack('<B', VERSION))
+        out.write(struct.pack('<I', len(self.strings)))
+        for s in self.strings:
+            data = s.encode('utf-8')
+            out.write(struct.pack('<I', len(data)))
+            out.write(data)
+        out.write(struct.pack('<I', len(self.shapes)))
+        for shape in self.shapes:
+            out.write(struct.pack('<H', len(shape)))
+            for k in shape:
+                out.write(struct.pack('<I', self.strings[k]))
+        out.write(self.records.getvalue())
+        return out.getvalue()
+
+
+def encode_tree(root_node):
+    """
+    Encodes a tree given as root Node (or the equivalent nested dicts) into bytes.
+    """
+    encoder = TreeEncoder()
+    encoder.write_node(root_node)
+    return encoder.getvalue()
+
+
+class TreeDecoder:
+
+    def __init__(self, data):
+        if data[:4] != MAGIC:
+            raise ValueError("Not a CTS binary tree")
+        if data[4] != VERSION:
+            raise ValueError("Unsupported CTS binary tree version {}".format(data[4]))
+        self.data = data
+        self.pos = 5
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def read_value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == NONE:
+            return None
+        elif tag == FALSE:
+            return False
+        elif tag == TRUE:
+            return True
+        elif tag == INT:
+            return self.unpack('<q')[0]
+        elif tag == FLOAT:
+            return self.unpack('<d')[0]
+        elif tag == STRING:
+            return self.strings[self.unpack('<I')[0]]
+        elif tag == LIST:
+            return [self.read_value() for _ in range(self.unpack('<I')[0])]
+        elif tag == DICT:
+            res = dict()
+            for _ in range(self.unpack('<I')[0]):
+                key = self.strings[self.unpack('<I')[0]]
+                res[key] = self.read_value()
+            return res
+        raise ValueError("Unknown value tag {}".format(tag))
+
+    def read(self):
+        self.strings = list()
+        for _ in range(self.unpack('<I')[0]):
+            length = self.unpack('<I')[0]
+            self.strings.append(self.data[self.pos:self.pos + length].decode('utf-8'))
+            self.pos += length
+
+        self.shapes = list()
+        for _ in range(self.unpack('<I')[0]):
+            count = self.unpack('<H')[0]
+            self.shapes.append([self.strings[i] for i in self.unpack('<{}I'.format(count))])
+
+        root = None
+        #[node dict, children still to read]
+        stack = list()
+        while True:
+            shape = self.shapes[self.unpack('<I')[0]]
+            node = {k: self.read_value() for k in shape if k != "metabolites"}
+            if "metabolites" in shape:
+                node["metabolites"] = list()
+            child_count = self.unpack('<I')[0]
+
+            if root is None:
+                root = node
+            else:
+                stack[-1][0]["metabolites"].append(node)
+                stack[-1][1] -= 1
+            if child_count > 0:
+                stack.append([node, child_count])
+            while stack and stack[-1][1] == 0:
+                stack.pop()
+            if not stack:
+                return root
+
+
+def decode_tree(data):
+    """
+    Decodes bytes produced by encode_tree into nested dicts, as json.loads would return them.
+    """
+    return TreeDecoder(data).read()
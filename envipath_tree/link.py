@@ -60,3 +60,14 @@ class Link:
         self.likelihood = df_paths.loc[self.rule]['Likelihood'] #Rule likelihood
         self.rule_description = df_paths.loc[self.rule]['Description'] #Rule description
         self.rule_url = self.base_url + self.rule  #Rule url
+
+    def set_indexed_info(self, rule_index):
+        #Pseudo links and unknown reactions are left untouched
+        info = rule_index.get(self.idreaction)
+        if info is None:
+            return
+
+        self.rule = info["rule"]
+        self.likelihood = info["likelihood"]
+        self.rule_description = info["rule_description"]
+        self.rule_url = info["rule_url"]
@@ -0,0 +1,123 @@
+import os
+import logging
+
+#Rule likelihood categories of paths.pkl, least likely first
+LIKELIHOODS = ["very unlikely", "unlikely", "neutral", "likely", "very likely"]
+
+#Rank of a likelihood category, -1 for links without a (known) likelihood
+def likelihood_rank(likelihood):
+    if not isinstance(likelihood, str):
+        return -1
+    likelihood = likelihood.strip().lower()
+    return LIKELIHOODS.index(likelihood) if likelihood in LIKELIHOODS else -1
+
+
+class RuleIndex:
+    """
+    Maps reaction URIs directly to their EAWAG-BBD rule name, likelihood, description and rule url,
+    so links can be enriched without fetching each reaction.
+    """
+
+    base_url = 'http://umbbd.ethz.ch/servlets/rule.jsp?rule='
+
+    def __init__(self, df_paths=None, records=None):
+        #rule name -> (likelihood, description), taken from the "paths" dataframe
+        self.rules = dict()
+        if df_paths is not None:
+            for rule, likelihood, description in zip(df_paths.index, df_paths['Likelihood'],
+                                                     df_paths['Description']):
+                self.rules[rule] = (likelihood, description)
+
+        #reaction uri -> joined rule record
+        self.reactions = dict(records) if records is not None else dict()
+
+        #Integer coded rule table, see encode()
+        self.encoded = None
+
+    def make_record(self, rule):
+        likelihood, description = self.rules.get(rule, (None, None))
+        return {
+            "rule": rule,
+            "likelihood": likelihood,
+            "rule_description": description,
+            "rule_url": self.base_url + rule,
+        }
+
+    def add(self, reaction_id, rule):
+        self.reactions[reaction_id] = self.make_record(rule)
+
+    def add_reaction_json(self, reaction):
+        """
+        Adds a reaction from its plain enviPath JSON.
+        """
+        rules = reaction.get("rules", [])
+        if len(rules) > 0:
+            self.add(reaction["id"], rules[0]["name"])
+
+    def encode(self):
+        """
+        Returns the rule table integer coded: a dict rule name -> code and a NumPy array
+        with the likelihood rank (index into LIKELIHOODS, -1 if unknown) of every code.
+        """
+        if self.encoded is None:
+            import numpy as np
+            rule_codes = {rule: code for code, rule in enumerate(self.rules)}
+            code_ranks = np.array([likelihood_rank(self.rules[rule][0]) for rule in rule_codes], dtype=np.int64)
+            self.encoded = (rule_codes, code_ranks)
+        return self.encoded
+
+    def get(self, reaction_id):
+        return self.reactions.get(reaction_id)
+
+    def missing(self, links):
+        """
+        Returns the reaction URIs of non-pseudo links (plain enviPath JSON) not covered by the index.
+        """
+        lst_missing = list()
+        for link in links:
+            idreaction = link.get("idreaction")
+            if link.get("pseudo") == False and idreaction is not None and idreaction not in self.reactions:
+                lst_missing.append(idreaction)
+        return lst_missing
+
+    @staticmethod
+    def build(reactions, df_paths):
+        """
+        Builds the index from a list of enviPath_python Reaction objects, e.g. Package.get_reactions().
+        """
+        rule_index = RuleIndex(df_paths)
+        reactions = list(reactions)
+        if len(reactions) > 0:
+            reactions[0].requester.prefetch(reactions)
+        for reaction in reactions:
+            rule = reaction.get_rule()
+            if rule is not None:
+                rule_index.add(reaction.get_id(), rule.get_name())
+        return rule_index
+
+    def save(self, path):
+        import pandas as pd
+        #Written aside and moved into place, processes may load it meanwhile
+        pd.DataFrame.from_dict(self.reactions, orient='index').to_pickle(path + '.tmp', compression=None)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path, df_paths=None):
+        """
+        Loads a saved index. Returns an empty index if the file does not exist,
+        reactions are then fetched one by one as they show up.
+        """
+        if not os.path.exists(path):
+            logging.warning("Rule index {} does not exist, reactions are fetched from enviPath".format(path))
+            return RuleIndex(df_paths)
+        import pandas as pd
+        records = pd.read_pickle(path).to_dict('index')
+        return RuleIndex(df_paths, records)
+
+
+if __name__ == "__main__":
+    # Builds reaction_rules.pkl (RULE_INDEX) ahead of deployment, from ENVIPATH_MIRROR if set
+    from cts_envipath import CTSEnvipath
+
+    rule_index = CTSEnvipath().build_rule_index()
+    print("Indexed reactions: " + str(len(rule_index.reactions)))
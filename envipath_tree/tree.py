@@ -1,5 +1,6 @@
 import json
 import copy
+from collections import deque
 from typing import List
 from typing import TypeVar
 from .node import Node
@@ -7,85 +8,365 @@ from .link import Link
 
 #PandasDataFrame = TypeVar('pandas.core.frame.DataFrame')
 
+from .rule_index import RuleIndex, likelihood_rank
+
+#Nominal probability of a transformation per likelihood category (same order as LIKELIHOODS),
+#last entry for links without a known likelihood
+LIKELIHOOD_SCORES = [0.1, 0.3, 0.5, 0.7, 0.9, 0.5]
+
+#Raised when building a tree would exceed the configured node ceiling
+class TreeTooLargeError(ValueError):
+    pass
+
 class Tree:
 
     #def __init__(self, nodes: List[Node], links: List[Link], pd):
-    def __init__(self, nodes, links, df_paths):
+    #node_limit is a hard ceiling on the nodes of a built tree, unlike the max_nodes
+    #option of build_tree exceeding it raises TreeTooLargeError
+    def __init__(self, nodes, links, df_paths, rule_index=None, node_limit=None):
         self.nodes = list()
         self.links = list()
         self.df_paths = df_paths
+        self.rule_index = rule_index
+        self.node_limit = node_limit
         self.max_depth = 0
         self.root_node = None
-        self.build_node_list(nodes)
-        self.build_link_list(links)
+
+        #enviPath node id -> node_num, ids of links already added
+        self.node_index = dict()
+        self.link_ids = set()
+        #node_num -> links leaving that node
+        self.source_links = dict()
+
+        #Last built tree flattened in breadth first order: node copies, index of the parent,
+        #link leading to the node (None for the root) and generation below the root
+        self.flat_nodes = list()
+        self.flat_parents = list()
+        self.flat_links = list()
+        self.flat_levels = list()
+
+        self.update(nodes, links)
+
+    #Add nodes and links of a (partial) pathway snapshot that have not been seen before.
+    #Snapshots may be passed in repeatedly while the pathway is still being predicted.
+    def update(self, nodes, links):
+        node_nums = self.build_node_list(nodes)
+        self.build_link_list(links, node_nums)
 
     #Build list of nodes, find max depth, set root node
+    #Returns the node_num of every node in the snapshot, by snapshot position
     def build_node_list(self, nodes):
+        node_nums = list()
         for idx in range(len(nodes)):
-            node = Node(idx, nodes[idx])
-            self.nodes.append(node)
-            if node.depth > self.max_depth:
-                self.max_depth = node.depth
-            if node.depth == 0:
-                self.root_node = node
+            key = nodes[idx].get("id", idx)
+            if key not in self.node_index:
+                node = Node(len(self.nodes), nodes[idx])
+                self.node_index[key] = node.node_num
+                self.nodes.append(node)
+                if node.depth > self.max_depth:
+                    self.max_depth = node.depth
+                if node.depth == 0:
+                    self.root_node = node
+            node_nums.append(self.node_index[key])
 
+        return node_nums
 
-    def build_link_list(self, links):
+    def build_link_list(self, links, node_nums=None):
         for idx in range(len(links)):
+            key = links[idx].get("id", idx)
+            if key in self.link_ids:
+                continue
+            self.link_ids.add(key)
+
             link = Link(links[idx])
+            #Snapshot positions -> node_num
+            if node_nums is not None:
+                link.source = node_nums[link.source]
+                link.target = node_nums[link.target]
             #rules = reaction['rules']
             #rule = rules[0]['name']
             #link.rule = rule       
-            link.set_reaction_info(self.df_paths)
+            if self.rule_index is not None:
+                link.set_indexed_info(self.rule_index)
+            else:
+                link.set_reaction_info(self.df_paths)
             self.links.append(link)
+            self.source_links.setdefault(link.source, list()).append(link)
 
     def find_source_links(self, node_num):
-        lst_source = list()
-        for link in self.links:
-            if link.source == node_num:
-                lst_source.append(link)
-
-        return lst_source
+        return self.source_links.get(node_num, list())
 
     def find_target_links(self, source_num, target_num):
         lst_target = list()
-        for link in self.links:
-            if link.source == source_num and link.target == target_num:
-                lst_target.append(copy.deepcopy(link))
+        for link in self.find_source_links(source_num):
+            if link.target == target_num:
+                lst_target.append(link)
         return lst_target
 
-    def build_tree(self):
-        self.recurse_nodes(self.root_node)
+    #Flat result shape: one record per (non-pseudo) node and one per edge, without expanding
+    #the routes into a nested tree. Links through a pseudo node (multi-product reactions) are
+    #collapsed to source -> product edges that keep the pseudo node's id, so co-products can be grouped.
+    def to_dag(self):
+        pseudo_nodes = set(link.target for link in self.links if link.pseudo == True)
 
-    #recursive function to build metabolite tree
-    def recurse_nodes(self, node):
-        lst_child_nodes = list()
-        source_links = self.find_source_links(node.node_num) 
+        dag_nodes = list()
+        for node in self.nodes:
+            if node.node_num not in pseudo_nodes:
+                dag_nodes.append({k: v for k, v in node.__dict__.items() if k != "metabolites"})
 
-        #This should be a terminal node - should not be a pseudo node
-        if len(source_links) == 0:
-            return lst_child_nodes
+        dag_edges = list()
+        seen = set()
+        for link in self.links:
+            #Links leaving a pseudo node are handled with the link into it
+            if link.source in pseudo_nodes:
+                continue
+            if link.pseudo == True:
+                pseudo_id = self.nodes[link.target].id
+                for pseudo_link in self.find_source_links(link.target):
+                    rule_link = pseudo_link if pseudo_link.rule is not None else link
+                    edge = self.dag_edge(link.source, pseudo_link.target, rule_link, pseudo_id)
+                    key = (edge["source"], edge["target"], edge["idreaction"], pseudo_id)
+                    if key not in seen:
+                        seen.add(key)
+                        dag_edges.append(edge)
+            else:
+                key = (link.source, link.target, link.idreaction, None)
+                if key not in seen:
+                    seen.add(key)
+                    dag_edges.append(self.dag_edge(link.source, link.target, link, None))
 
-        for link in source_links:
+        return {
+            "root": self.root_node.node_num if self.root_node is not None else None,
+            "nodes": dag_nodes,
+            "edges": dag_edges,
+        }
+
+    def dag_edge(self, source, target, link, pseudo_id):
+        return {
+            "source": source,
+            "target": target,
+            "idreaction": link.idreaction,
+            "rule": link.rule,
+            "rule_url": link.rule_url,
+            "likelihood": link.likelihood,
+            "rule_description": link.rule_description,
+            "pseudo": pseudo_id is not None,
+            "pseudo_id": pseudo_id,
+        }
+
+    #max_depth limits the number of generations expanded below the root,
+    #nodes with further metabolites are then marked as truncated.
+    #min_likelihood (a rule likelihood category) and top_k (children per node, most likely first)
+    #prune branches before they are expanded, max_nodes caps the total size of the tree.
+    def build_tree(self, max_depth=None, min_likelihood=None, top_k=None, max_nodes=None):
+        self.check_options(max_depth, min_likelihood, top_k, max_nodes)
+        self.expand_nodes(self.root_node, max_depth, min_likelihood, top_k, max_nodes)
+
+    #Raises ValueError for build options build_tree can not use
+    @staticmethod
+    def check_options(max_depth=None, min_likelihood=None, top_k=None, max_nodes=None):
+        for name, value, minimum in (("depth", max_depth, 0), ("top_k", top_k, 0), ("max_nodes", max_nodes, 1)):
+            if value is not None and (type(value) is not int or value < minimum):
+                raise ValueError("{} must be an integer of at least {}".format(name, minimum))
+        if min_likelihood is not None and likelihood_rank(min_likelihood) < 0:
+            raise ValueError("Unknown likelihood {}".format(min_likelihood))
+
+    #Expanded copy of the subtree below a node, e.g. to load a truncated branch later
+    def build_subtree(self, node_id, max_depth=None, min_likelihood=None, top_k=None, max_nodes=None):
+        self.check_options(max_depth, min_likelihood, top_k, max_nodes)
+        for node in self.nodes:
+            if node.id == node_id:
+                subtree_root = copy.deepcopy(node)
+                subtree_root.metabolites = list()
+                self.expand_nodes(subtree_root, max_depth, min_likelihood, top_k, max_nodes)
+                return subtree_root
+        raise ValueError("Node {} is not part of the pathway".format(node_id))
+
+    #Children of a node as (link carrying the rule, target node_num), in link order
+    def find_children(self, node_num):
+        lst_children = list()
+        for link in self.find_source_links(node_num):
             #Get the target of the pseudo link
             if link.pseudo == True:
                 target_links = self.find_source_links(link.target)
                 for target_link in target_links:
-                    pseudo_target_links = self.find_target_links(target_link.source, target_link.target)  
+                    pseudo_target_links = self.find_target_links(target_link.source, target_link.target)
                     for pseudo_target_link in pseudo_target_links:
-                        lst_child_nodes.append(copy.deepcopy(self.nodes[pseudo_target_link.target]))
+                        rule_link = pseudo_target_link if pseudo_target_link.rule is not None else link
+                        lst_children.append((rule_link, pseudo_target_link.target))
             else:
                 target_links = self.find_target_links(link.source, link.target)
                 for target_link in target_links:
-                        lst_child_nodes.append(copy.deepcopy(self.nodes[target_link.target]))
+                    lst_children.append((target_link, target_link.target))
+        return lst_children
 
-        for child_node in lst_child_nodes:            
-            self.recurse_nodes(child_node)
-            
-        node.metabolites.extend(lst_child_nodes)    
-                  
-        return lst_child_nodes
+    def select_children(self, lst_children, min_likelihood=None, top_k=None):
+        if min_likelihood is not None:
+            min_rank = likelihood_rank(min_likelihood)
+            if min_rank < 0:
+                raise ValueError("Unknown likelihood {}".format(min_likelihood))
+            lst_children = [c for c in lst_children if likelihood_rank(c[0].likelihood) >= min_rank]
+        if top_k is not None:
+            lst_children = sorted(lst_children, key=lambda c: likelihood_rank(c[0].likelihood), reverse=True)[:top_k]
+        return lst_children
+
+    #Builds the metabolite tree below node, breadth first so that a max_nodes budget
+    #keeps the first generations complete. Only selected children are ever copied.
+    def expand_nodes(self, node, max_depth=None, min_likelihood=None, top_k=None, max_nodes=None):
+        self.flat_nodes = [node]
+        self.flat_parents = [-1]
+        self.flat_links = [None]
+        self.flat_levels = [0]
+
+        num_nodes = 1
+        queue = deque([(node, 0, 0)])
+        while queue:
+            node, level, flat_idx = queue.popleft()
+            lst_children = self.find_children(node.node_num)
+
+            #This should be a terminal node - should not be a pseudo node
+            if len(lst_children) == 0:
+                continue
+
+            if max_depth is not None and level >= max_depth:
+                node.truncated = True
+                continue
+
+            lst_children = self.select_children(lst_children, min_likelihood, top_k)
+            if max_nodes is not None and num_nodes + len(lst_children) > max_nodes:
+                lst_children = lst_children[:max(0, max_nodes - num_nodes)]
+                node.truncated = True
+            num_nodes += len(lst_children)
+            if self.node_limit is not None and num_nodes > self.node_limit:
+                raise TreeTooLargeError("Result too large: tree exceeds {} nodes".format(self.node_limit))
+
+            for link, target in lst_children:
+                child_node = copy.deepcopy(self.nodes[target])
+                node.metabolites.append(child_node)
+                queue.append((child_node, level + 1, len(self.flat_nodes)))
+                self.flat_nodes.append(child_node)
+                self.flat_parents.append(flat_idx)
+                self.flat_links.append(link)
+                self.flat_levels.append(level + 1)
+
+        return node
+
+    #Product of the rule likelihoods (LIKELIHOOD_SCORES) along the path from the root
+    #to every node of the last built tree, as NumPy array in flat (breadth first) order
+    def path_scores(self):
+        if len(self.flat_nodes) == 0:
+            raise ValueError("The tree has to be built before it can be scored")
+        import numpy as np
+
+        rule_index = self.rule_index if self.rule_index is not None else RuleIndex(self.df_paths)
+        rule_codes, code_ranks = rule_index.encode()
+        scores_by_rank = np.array(LIKELIHOOD_SCORES)
+
+        parents = np.array(self.flat_parents, dtype=np.int64)
+        levels = np.array(self.flat_levels, dtype=np.int64)
+        codes = np.array([rule_codes.get(link.rule, -1) if link is not None else -1 for link in self.flat_links],
+                         dtype=np.int64)
+        #Code -1 (rule not in the table) and rank -1 (unknown likelihood) both pick the last entry
+        ranks = np.append(code_ranks, -1)[codes]
+        scores = scores_by_rank[ranks]
 
+        #Breadth first order keeps each generation contiguous and after its parents
+        path_scores = np.ones(len(parents))
+        bounds = np.searchsorted(levels, np.arange(levels.max() + 2))
+        for level in range(1, len(bounds) - 1):
+            start, end = bounds[level], bounds[level + 1]
+            path_scores[start:end] = path_scores[parents[start:end]] * scores[start:end]
+        return path_scores
+
+    #Scores every metabolite of the last built tree by its path_scores. Sets on every node
+    #   path_likelihood: score of the path to this occurrence, generation: its generation
+    #   best_likelihood, best_generation: score and generation of the best occurrence of the same metabolite
+    #Returns the best occurrence per metabolite as (flat index, score) pairs, best first.
+    def score_paths(self):
+        import numpy as np
+
+        path_scores = self.path_scores()
+        levels = np.array(self.flat_levels, dtype=np.int64)
+
+        #Best occurrence of every metabolite: highest score, then lowest generation
+        metabolite_codes = dict()
+        keys = np.array([metabolite_codes.setdefault(node.id if node.id is not None else node.smiles,
+                                                     len(metabolite_codes)) for node in self.flat_nodes],
+                        dtype=np.int64)
+        order = np.lexsort((levels, -path_scores, keys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[order][1:] != keys[order][:-1]
+        best_idx = np.empty(len(metabolite_codes), dtype=np.int64)
+        best_idx[keys[order][first]] = order[first]
+
+        for idx, node in enumerate(self.flat_nodes):
+            best = best_idx[keys[idx]]
+            node.path_likelihood = float(path_scores[idx])
+            node.generation = int(levels[idx])
+            node.best_likelihood = float(path_scores[best])
+            node.best_generation = int(levels[best])
+
+        ranking = best_idx[np.lexsort((levels[best_idx], -path_scores[best_idx]))]
+        return [(int(idx), float(path_scores[idx])) for idx in ranking]
+
+    #Unique metabolites of the last built tree, one record per SMILES in order of first appearance:
+    #lowest generation, best path likelihood (see path_scores), number of routes (occurrences
+    #in the tree) and the SMILES of its distinct parents
+    def metabolite_table(self):
+        path_scores = self.path_scores()
+
+        records = dict()
+        for idx, node in enumerate(self.flat_nodes):
+            parent = self.flat_parents[idx]
+            record = records.get(node.smiles)
+            if record is None:
+                record = {
+                    "smiles": node.smiles,
+                    "id": node.id,
+                    "min_generation": self.flat_levels[idx],
+                    "best_likelihood": float(path_scores[idx]),
+                    "routes": 0,
+                    "parents": list(),
+                }
+                records[node.smiles] = record
+            record["routes"] += 1
+            record["best_likelihood"] = max(record["best_likelihood"], float(path_scores[idx]))
+            #Breadth first, so the first occurrence has the lowest generation
+            if parent >= 0:
+                parent_smiles = self.flat_nodes[parent].smiles
+                if parent_smiles not in record["parents"]:
+                    record["parents"].append(parent_smiles)
+
+        return list(records.values())
+
+    #Metabolites of the last built tree ranked by their best path likelihood (see score_paths),
+    #with the SMILES along that path starting at the root
+    def rank_metabolites(self, top=None):
+        ranking = self.score_paths()
+        if top is not None:
+            ranking = ranking[:top]
+
+        lst_ranked = list()
+        for idx, score in ranking:
+            path = list()
+            parent = idx
+            while parent >= 0:
+                path.append(self.flat_nodes[parent].smiles)
+                parent = self.flat_parents[parent]
+            node = self.flat_nodes[idx]
+            lst_ranked.append({
+                "id": node.id,
+                "smiles": node.smiles,
+                "likelihood": score,
+                "generation": self.flat_levels[idx],
+                "path": path[::-1],
+            })
+        return lst_ranked
+
+    #recursive function to build metabolite tree
+    def recurse_nodes(self, node, max_depth=None):
+        self.expand_nodes(node, max_depth)
+        return node.metabolites
     
 
 #recursive function to build metabolite tree
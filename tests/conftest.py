@@ -0,0 +1,78 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envipath_tree.rule_index import RuleIndex, LIKELIHOODS
+
+
+#One rule per likelihood category, rule name -> likelihood
+RULES = {"bt{:04d}".format(idx + 1): likelihood.title() for idx, likelihood in enumerate(LIKELIHOODS)}
+
+
+@pytest.fixture
+def df_paths():
+    import pandas as pd
+    return pd.DataFrame({
+        "Likelihood": list(RULES.values()),
+        "Description": ["rule {}".format(rule) for rule in RULES],
+    }, index=list(RULES))
+
+
+def make_rule_index(df_paths, links):
+    """
+    Rule index for links whose idreaction is "R<rule name>".
+    """
+    rule_index = RuleIndex(df_paths)
+    for link in links:
+        if link.get("idreaction"):
+            rule_index.add(link["idreaction"], link["idreaction"][1:])
+    return rule_index
+
+
+def random_pathway(seed, num_nodes=30):
+    """
+    Plain enviPath JSON of a random pathway without cycles: every link points to a node
+    created later. About a fifth of the reactions have several products and go through a pseudo node.
+    """
+    rng = random.Random(seed)
+    rules = list(RULES)
+    nodes = [{"id": "n0", "smiles": "C0", "depth": 0}]
+    links = list()
+    metabolites = [0]
+
+    def add_node(depth, pseudo=False):
+        idx = len(nodes)
+        node = {"id": "n{}".format(idx), "smiles": "P{}".format(idx) if pseudo else "C{}".format(idx),
+                "depth": depth}
+        if pseudo:
+            node["pseudo"] = True
+        nodes.append(node)
+        return idx
+
+    while len(nodes) < num_nodes:
+        source = rng.choice(metabolites)
+        depth = nodes[source]["depth"] + 1
+        reaction = "R" + rng.choice(rules)
+        if rng.random() < 0.2:
+            pseudo = add_node(depth, pseudo=True)
+            links.append({"id": "l{}".format(len(links)), "source": source, "target": pseudo, "pseudo": True,
+                          "idreaction": reaction})
+            for _ in range(rng.randint(2, 3)):
+                target = add_node(depth)
+                metabolites.append(target)
+                links.append({"id": "l{}".format(len(links)), "source": pseudo, "target": target,
+                              "pseudo": False, "idreaction": reaction})
+        else:
+            later = [idx for idx in metabolites if idx > source]
+            if later and rng.random() < 0.3:
+                target = rng.choice(later)
+            else:
+                target = add_node(depth)
+                metabolites.append(target)
+            links.append({"id": "l{}".format(len(links)), "source": source, "target": target, "pseudo": False,
+                          "idreaction": reaction})
+    return nodes, links
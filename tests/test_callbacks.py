@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from cts_callbacks import CallbackStore, check_callback_url
+
+
+@pytest.mark.parametrize("url", ["ftp://93.184.216.34/", "http:///path", "http://127.0.0.1/", "http://10.1.2.3/",
+                                 "http://169.254.169.254/latest", "http://[::1]/", "http://0.0.0.0/"])
+def test_rejected_callback_urls(url):
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_allowed_callback_urls():
+    check_callback_url("https://93.184.216.34/callback")
+    check_callback_url("http://10.1.2.3:8080/callback", allowed_hosts={"10.1.2.3"})
+
+
+def test_jobs_are_claimed_once(tmp_path):
+    store = CallbackStore(str(tmp_path / "results.db"))
+    store.add_job("job", "CCO", 1, "https://example.org/", {"shape": "dag"})
+    assert store.runnable(time.time()) == ["job"]
+
+    job = store.claim("job", time.time() - 60)
+    assert job == {"smiles": "CCO", "gen_limit": 1, "callback_url": "https://example.org/",
+                   "options": {"shape": "dag"}}
+    assert store.claim("job", time.time() - 60) is None
+    assert store.runnable(time.time() - 60) == []
+
+    # Taken over once the claim is stale, e.g. after the worker died
+    assert store.runnable(time.time() + 1) == ["job"]
+    assert store.claim("job", time.time() + 1) is not None
+
+    store.finish("job", "delivered")
+    assert store.claim("job", time.time() + 1) is None
+
+
+def test_log_is_shared_between_stores(tmp_path):
+    path = str(tmp_path / "results.db")
+    CallbackStore(path).log({"job_id": "job", "callback_url": "u", "state": "queued", "attempt": 0,
+                             "status_code": None, "error": None, "time": 1.0})
+    log = CallbackStore(path).get_log("job")
+    assert [entry["state"] for entry in log] == ["queued"]
+    assert CallbackStore(path).get_log("other") == []
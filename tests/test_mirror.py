@@ -0,0 +1,72 @@
+import pytest
+
+from enviPath_python.enums import Endpoint
+from enviPath_python.mirror import MirrorRequester, PackageMirror
+from enviPath_python.objects import Package, Reaction
+
+PACKAGE = "https://envipath.org/package/p"
+
+
+def reaction(idx, rule):
+    return {"id": "{}/reaction/r{}".format(PACKAGE, idx), "identifier": "reaction", "name": "reaction {}".format(idx),
+            "smirks": "C>>CO", "rules": [{"id": "{}/simple-rule/{}".format(PACKAGE, rule), "name": rule,
+                                          "identifier": "simple-rule"}]}
+
+
+@pytest.fixture
+def mirror_path(tmp_path):
+    path = str(tmp_path / "mirror.db")
+    mirror = PackageMirror(path)
+    mirror.store(PACKAGE, Endpoint.PACKAGE.value, {"id": PACKAGE, "name": "Package"})
+    for idx, rule in enumerate(["bt0001", "bt0002"]):
+        mirror.store(PACKAGE, Endpoint.REACTION.value, reaction(idx, rule))
+    mirror.store(PACKAGE, Endpoint.SIMPLERULE.value,
+                 {"id": PACKAGE + "/simple-rule/bt0001", "identifier": "simple-rule", "name": "bt0001"})
+    mirror.conn.commit()
+    mirror.close()
+    return path
+
+
+def test_objects_round_trip(mirror_path):
+    requester = MirrorRequester(mirror_path)
+    assert requester.get_json(PACKAGE + "/reaction/r1") == reaction(1, "bt0002")
+    assert requester.get_json(PACKAGE + "/reaction/r1/") == reaction(1, "bt0002")
+
+    package = Package(requester, id=PACKAGE)
+    reactions = package.get_reactions()
+    assert sorted(r.get_name() for r in reactions) == ["reaction 0", "reaction 1"]
+    assert sorted(r.get_rule().get_name() for r in reactions) == ["bt0001", "bt0002"]
+    assert [rule.get_name() for rule in package.get_rules()] == ["bt0001"]
+    assert package.get_compounds() == []
+
+
+def test_prefetch_loads_from_mirror(mirror_path):
+    requester = MirrorRequester(mirror_path)
+    reactions = [Reaction(requester, id=PACKAGE + "/reaction/r{}".format(idx)) for idx in range(2)]
+    assert requester.prefetch(reactions) == 2
+    assert all(r.loaded for r in reactions)
+    assert requester.prefetch(reactions) == 0
+
+
+def test_read_only_and_missing(mirror_path):
+    requester = MirrorRequester(mirror_path)
+    with pytest.raises(ValueError):
+        requester.post_request(PACKAGE + "/pathway", payload={"smilesinput": "C"})
+    with pytest.raises(ValueError):
+        requester.get_json(PACKAGE + "/reaction/unknown")
+    with pytest.raises(ValueError):
+        MirrorRequester(mirror_path + ".missing")
+
+
+def test_sync_from_export(tmp_path):
+    export = {"id": PACKAGE, "identifier": "package", "name": "Package",
+              "reactions": [reaction(0, "bt0001"), {"id": reaction(0, "bt0001")["id"], "identifier": "reaction"}],
+              "rules": [{"id": PACKAGE + "/simple-rule/bt0001", "identifier": "simple-rule", "name": "bt0001"}]}
+    path = str(tmp_path / "export.db")
+    mirror = PackageMirror(path)
+    assert mirror.sync_from_export(PACKAGE, export) == 3
+    mirror.close()
+
+    requester = MirrorRequester(path)
+    # The most complete occurrence of an object is kept
+    assert requester.get_json(PACKAGE + "/reaction/r0") == reaction(0, "bt0001")
@@ -0,0 +1,74 @@
+import gc
+
+from enviPath_python.enviPath import enviPathRequester
+from enviPath_python.objects import Compound, Pathway, Reaction
+
+REACTION = "https://envipath.org/package/p/reaction/r"
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeRequester(enviPathRequester):
+    def __init__(self):
+        super().__init__()
+        self.requests = list()
+
+    def get_request(self, url, params=None, payload=None, **kwargs):
+        self.requests.append(url)
+        return FakeResponse({"id": url, "name": "loaded", "smirks": "C>>CO", "lastModified": 1})
+
+    def delete_request(self, url, params=None, payload=None, **kwargs):
+        self.requests.append(url)
+
+
+def test_same_class_and_id_share_an_instance():
+    requester = FakeRequester()
+    reaction = Reaction(requester, id=REACTION)
+    assert Reaction(requester, id=REACTION, name="other") is reaction
+    # Other types under the same id are separate objects
+    assert Compound(requester, id=REACTION) is not reaction
+    assert Reaction(FakeRequester(), id=REACTION) is not reaction
+
+
+def test_repeated_init_keeps_loaded_state():
+    requester = FakeRequester()
+    reaction = Reaction(requester, id=REACTION)
+    assert reaction.get_smirks() == "C>>CO"
+
+    again = Reaction(requester, id=REACTION, name="listed")
+    assert again.loaded
+    assert again.get_smirks() == "C>>CO"
+    assert again.get_name() == "loaded"
+    assert requester.requests == [REACTION]
+
+
+def test_unused_instances_are_dropped():
+    requester = FakeRequester()
+    reaction = Reaction(requester, id=REACTION)
+    reaction.get_smirks()
+    del reaction
+    gc.collect()
+    assert not Reaction(requester, id=REACTION).loaded
+
+
+def test_delete_forgets_the_instance():
+    requester = FakeRequester()
+    reaction = Reaction(requester, id=REACTION)
+    reaction.delete()
+    assert requester.requests == [REACTION]
+    assert Reaction(requester, id=REACTION) is not reaction
+
+
+def test_pathways_are_not_mapped():
+    requester = FakeRequester()
+    pathway_id = "https://envipath.org/package/p/pathway/w"
+    pathway = Pathway(requester, id=pathway_id)
+    assert pathway.lastmodified() == 1
+    assert Pathway(requester, id=pathway_id) is not pathway
+    assert not Pathway(requester, id=pathway_id).loaded
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from cts_pathway_index import PathwayIndex
+
+
+class Listed:
+    def __init__(self, pathway_id, description, root="C1=CC=CC=C1", last_modified=7):
+        self.pathway_id = pathway_id
+        self.json = {"id": pathway_id, "description": description, "lastModified": last_modified,
+                     "nodes": [{"depth": 0, "smiles": root}, {"depth": 1, "smiles": "Oc1ccccc1"}]}
+
+    def get_id(self):
+        return self.pathway_id
+
+    def get_json(self):
+        return self.json
+
+
+class ListedPackage:
+    def __init__(self, pathways, delay=0):
+        self.pathways = pathways
+        self.delay = delay
+        self.listings = 0
+
+    def get_pathways(self):
+        self.listings += 1
+        time.sleep(self.delay)
+        return self.pathways
+
+
+def test_indexed_by_requested_and_root_smiles():
+    index = PathwayIndex()
+    index.refresh(ListedPackage([
+        Listed("new", PathwayIndex.description("cts-d1-n32", "c1ccccc1")),
+        Listed("old", "A pathway created via REST using setting cts-d2-n64"),
+        Listed("other", "Some pathway"),
+    ]))
+
+    assert index.entries[("c1ccccc1", "cts-d1-n32")] == [(7, "new")]
+    assert index.entries[("C1=CC=CC=C1", "cts-d1-n32")] == [(7, "new")]
+    assert index.entries[("C1=CC=CC=C1", "cts-d2-n64")] == [(7, "old")]
+    assert index.indexed == {"new", "old", "other"}
+
+
+def test_refresh_in_batches():
+    index = PathwayIndex(max_fetch=2)
+    package = ListedPackage([Listed(str(idx), PathwayIndex.description("cts-d1-n32", "C{}".format(idx)))
+                             for idx in range(5)])
+    assert index.refresh(package)
+    assert index.refresh(package)
+    assert not index.refresh(package)
+    assert len(index.indexed) == 5
+
+
+def test_one_refresh_at_a_time():
+    index = PathwayIndex()
+    package = ListedPackage([Listed("a", PathwayIndex.description("cts-d1-n32", "C"))], delay=0.2)
+    threads = [threading.Thread(target=index.refresh, args=(package,)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert package.listings == 1
+
+
+def test_newest_first_and_remove():
+    index = PathwayIndex()
+    index.add("C", "cts-d1-n32", "a", 1)
+    index.add("C", "cts-d1-n32", "b", 2)
+    index.add("C", "cts-d1-n32", "b", 2)
+    assert index.entries[("C", "cts-d1-n32")] == [(2, "b"), (1, "a")]
+    index.remove("b")
+    assert index.entries[("C", "cts-d1-n32")] == [(1, "a")]
@@ -0,0 +1,41 @@
+import json
+
+from cts_prewarm import ProgressLog, read_compounds, run_jobs
+
+
+def test_read_compounds(tmp_path):
+    txt = tmp_path / "compounds.txt"
+    txt.write_text("# comment\nCCO\n\nc1ccccc1\n")
+    assert read_compounds(str(txt), [1, 2]) == [("CCO", 1), ("CCO", 2), ("c1ccccc1", 1), ("c1ccccc1", 2)]
+
+    csv = tmp_path / "compounds.csv"
+    csv.write_text("smiles,gen_limit\nCCO,2\nCCC,\n")
+    assert read_compounds(str(csv), [1]) == [("CCO", 2), ("CCC", 1)]
+
+
+def test_run_jobs_resumes_and_records_errors(tmp_path):
+    path = str(tmp_path / "progress.jsonl")
+    calls = list()
+
+    def work(smiles, gen_limit):
+        calls.append(smiles)
+        if smiles == "bad":
+            raise RuntimeError("boom")
+        return "ok", {"summary": [smiles]}
+
+    compounds = [("CCO", 1), ("bad", 1), ("CCO", 1)]
+    assert run_jobs(ProgressLog(path), compounds, work, 2, shape="tree", summary=True) == (2, 1)
+    assert sorted(calls) == ["CCO", "bad"]
+
+    entries = [json.loads(line) for line in open(path)]
+    by_smiles = {entry["smiles"]: entry for entry in entries}
+    assert by_smiles["bad"]["status"] == "error" and by_smiles["bad"]["error"] == "boom"
+    assert by_smiles["CCO"]["summary"] == ["CCO"] and by_smiles["CCO"]["shape"] == "tree"
+
+    # Only the failed job runs again, and options are part of the key
+    calls.clear()
+    assert run_jobs(ProgressLog(path), compounds, work, 2, shape="tree", summary=True) == (1, 1)
+    assert calls == ["bad"]
+    calls.clear()
+    run_jobs(ProgressLog(path), [("CCO", 1)], work, 2, shape="tree", summary=False)
+    assert calls == ["CCO"]
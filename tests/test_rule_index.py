@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from conftest import make_rule_index
+from envipath_tree.rule_index import RuleIndex
+
+
+@pytest.fixture
+def ctsenvipath(tmp_path, monkeypatch, df_paths):
+    monkeypatch.setenv("RESULT_CACHE", str(tmp_path / "results.db"))
+    monkeypatch.setenv("RULE_INDEX", str(tmp_path / "reaction_rules.pkl"))
+    monkeypatch.delenv("ENVIPATH_MIRROR", raising=False)
+    from cts_envipath import CTSEnvipath
+    ctsenvipath = CTSEnvipath()
+    ctsenvipath._df_paths = df_paths
+    ctsenvipath._rule_index = RuleIndex(df_paths)
+    return ctsenvipath
+
+
+def test_save_and_load(tmp_path, df_paths):
+    path = str(tmp_path / "index.pkl")
+    assert RuleIndex.load(path, df_paths).reactions == {}
+
+    rule_index = make_rule_index(df_paths, [{"idreaction": "Rbt0001"}, {"idreaction": "Rbt0004"}])
+    rule_index.save(path)
+    assert RuleIndex.load(path, df_paths).reactions == rule_index.reactions
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_index_file_is_picked_up_once_built(ctsenvipath, df_paths):
+    ctsenvipath.rule_index.add("Rbt0002", "bt0002")
+    ctsenvipath.refresh_rule_index()
+    assert not ctsenvipath.rule_index_built
+
+    make_rule_index(df_paths, [{"idreaction": "Rbt0001"}]).save(ctsenvipath.rule_index_path)
+    ctsenvipath.refresh_rule_index()
+    assert ctsenvipath.rule_index_built
+    # Reactions fetched one at a time meanwhile are kept
+    assert sorted(ctsenvipath.rule_index.reactions) == ["Rbt0001", "Rbt0002"]
+
+
+def test_build_runs_once(ctsenvipath, df_paths, monkeypatch):
+    builds = list()
+
+    def build_rule_index():
+        builds.append(1)
+        # A second builder finds the lock taken
+        ctsenvipath.run_rule_index_build()
+        rule_index = make_rule_index(df_paths, [{"idreaction": "Rbt0001"}])
+        rule_index.save(ctsenvipath.rule_index_path)
+        return rule_index
+
+    monkeypatch.setattr(ctsenvipath, "build_rule_index", build_rule_index)
+    ctsenvipath.run_rule_index_build()
+    assert len(builds) == 1
+    ctsenvipath.run_rule_index_build()
+    assert len(builds) == 1
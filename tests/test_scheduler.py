@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from enviPath_python.scheduler import RequestScheduler, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(10, burst=2)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.1)
+    bucket.refill(bucket.updated + 0.05)
+    assert bucket.wait_time() == pytest.approx(0.05)
+    bucket.refill(bucket.updated + 10)
+    assert bucket.tokens == 2
+
+
+@pytest.mark.parametrize("method, url, category", [
+    ("POST", "https://envipath.org/package/p/pathway", "submit"),
+    ("POST", "https://envipath.org/package/p/pathway/", "submit"),
+    ("GET", "https://envipath.org/package/p/pathway/w", "poll"),
+    ("POST", "https://envipath.org/package/p/simple-rule/r", "enrich"),
+    ("POST", "https://envipath.org/", "enrich"),
+    ("DELETE", "https://envipath.org/package/p/pathway/w", "enrich"),
+    ("GET", "https://envipath.org/package/p/reaction/r", "enrich"),
+])
+def test_categorize(method, url, category):
+    assert RequestScheduler.categorize(method, url) == category
+
+
+def test_category_context_overrides_default():
+    scheduler = RequestScheduler(1)
+    with scheduler.category("enrich"):
+        assert scheduler.get_category("POST", "https://envipath.org/package/p/pathway") == "enrich"
+        assert scheduler.get_category("GET", "x", category="poll") == "poll"
+    assert scheduler.get_category("POST", "https://envipath.org/package/p/pathway") == "submit"
+    with pytest.raises(ValueError):
+        scheduler.get_category("GET", "x", category="bogus")
+
+
+def test_waiting_requests_go_by_priority():
+    scheduler = RequestScheduler(10, burst=1)
+    scheduler.acquire("enrich")
+
+    order = list()
+    threads = list()
+    for category in ["enrich", "poll", "submit"]:
+        thread = threading.Thread(target=lambda c=category: order.append(scheduler.acquire(c) or c))
+        thread.start()
+        threads.append(thread)
+        # Every request is waiting before the next token is available after 0.1 s
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["submit", "poll", "enrich"]
+
+
+def test_exhausted_category_does_not_block_others():
+    scheduler = RequestScheduler(100, burst=1, limits={"submit": 0.1})
+    scheduler.acquire("submit")
+
+    # The next submission has to wait 10 s for its category, lower priorities go ahead meanwhile
+    outcome = list()
+
+    def submit():
+        try:
+            scheduler.acquire("submit", time.monotonic() + 0.5)
+            outcome.append("sent")
+        except TimeoutError:
+            outcome.append("timed out")
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    time.sleep(0.01)
+    start = time.monotonic()
+    scheduler.acquire("enrich", time.monotonic() + 1)
+    assert time.monotonic() - start < 0.4
+    thread.join(5)
+    assert outcome == ["timed out"]
+
+
+def test_deadline_raises():
+    scheduler = RequestScheduler(0.1, burst=1)
+    scheduler.acquire("poll")
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        scheduler.acquire("poll", deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - start < 1
+    assert scheduler.waiting == []
+
+
+def test_pause_holds_back_requests():
+    scheduler = RequestScheduler(100)
+    scheduler.pause(0.2)
+    start = time.monotonic()
+    scheduler.acquire("submit")
+    assert time.monotonic() - start >= 0.15
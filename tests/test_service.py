@@ -0,0 +1,187 @@
+import contextlib
+import json
+import time
+
+import pytest
+
+from conftest import random_pathway
+from cts_envipath import CTSEnvipath, PredictionCancelled
+from enviPath_python.enviPath import DeadlineExceeded
+from enviPath_python.objects import Pathway
+from envipath_tree import binary
+from envipath_tree.rule_index import RuleIndex
+
+PATHWAY = "https://envipath.org/package/p/pathway/w"
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeRequester:
+    """
+    Serves one predicted pathway, whose completed flag goes through states (one per poll, the last
+    one repeats), and the reactions of its links.
+    """
+
+    def __init__(self, states=("false", "true")):
+        self.nodes, self.links = random_pathway(1)
+        self.states = list(states)
+        self.polls = 0
+        self.deleted = list()
+
+    def deadline(self, deadline):
+        return contextlib.nullcontext()
+
+    def pathway_json(self):
+        return {"id": PATHWAY, "completed": self.states[min(self.polls, len(self.states) - 1)], "upToDate": True,
+                "lastModified": 123, "nodes": self.nodes, "links": self.links}
+
+    def get_json(self, url):
+        if url == PATHWAY:
+            data = self.pathway_json()
+            self.polls += 1
+            return data
+        return {"id": url, "rules": [{"name": url[1:]}]}
+
+    def get_request(self, url):
+        return FakeResponse(self.pathway_json())
+
+    def delete_request(self, url):
+        self.deleted.append(url)
+
+
+class FakePackage:
+    def __init__(self, requester):
+        self.requester = requester
+        self.predictions = 0
+
+    def predict(self, smiles, name=None, setting=None, description=None):
+        self.predictions += 1
+        return Pathway(self.requester, id=PATHWAY)
+
+    def get_pathways(self):
+        return []
+
+
+class FakeClient:
+    def __init__(self, requester):
+        self.requester = requester
+        self.package = FakePackage(requester)
+
+    def get_package(self, package_id):
+        return self.package
+
+
+@pytest.fixture
+def ctsenvipath(tmp_path, monkeypatch, df_paths):
+    monkeypatch.setenv("RESULT_CACHE", str(tmp_path / "results.db"))
+    monkeypatch.setenv("RULE_INDEX", str(tmp_path / "reaction_rules.pkl"))
+    monkeypatch.delenv("ENVIPATH_MIRROR", raising=False)
+    ctsenvipath = CTSEnvipath()
+    ctsenvipath._df_paths = df_paths
+    ctsenvipath._rule_index = RuleIndex(df_paths)
+    ctsenvipath.client = FakeClient(FakeRequester())
+    ctsenvipath.client_time = time.time()
+    ctsenvipath.poll_interval = 1
+    monkeypatch.setattr(ctsenvipath, "start_indexing", lambda: None)
+    monkeypatch.setattr("cts_envipath.time.sleep", lambda seconds: None)
+    return ctsenvipath
+
+
+def test_reused_pathway_is_served_from_cache(ctsenvipath):
+    client = ctsenvipath.client
+    tree, etag = ctsenvipath.get_envipath_result("C0", 2)
+    assert "error" not in json.loads(tree)
+    assert client.package.predictions == 1
+    polls = client.requester.polls
+
+    assert ctsenvipath.get_envipath_result("C0", 2) == (tree, etag)
+    assert client.package.predictions == 1
+    assert client.requester.polls == polls
+
+
+@pytest.mark.parametrize("stop", ["deadline", "cancel"])
+def test_unfinished_prediction_is_discarded(ctsenvipath, stop):
+    client = ctsenvipath.client
+    client.requester.states = ["false"]
+    ctsenvipath.delete_unfinished = True
+    if stop == "deadline":
+        events = ctsenvipath.iter_envipath_tree("C0", 2, timeout=0.05)
+        error = DeadlineExceeded
+    else:
+        events = ctsenvipath.iter_envipath_tree("C0", 2, cancelled=lambda: client.requester.polls > 2)
+        error = PredictionCancelled
+
+    with pytest.raises(error):
+        list(events)
+    assert client.requester.deleted == [PATHWAY]
+    assert ctsenvipath.pathway_index.find(client.package, "C0", ctsenvipath.set_setting_id(2)) is None
+
+
+@pytest.fixture
+def app_client(ctsenvipath, monkeypatch):
+    import cts_envipath_flask
+    monkeypatch.setattr(cts_envipath_flask, "ctsenvipath", ctsenvipath)
+    with cts_envipath_flask.app.test_client() as client:
+        yield client
+
+
+def test_binary_trees_are_not_compressed(app_client):
+    url = "/envipath/rest/run?smiles=C0&gen_limit=2"
+    compressed = app_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.content_encoding == "gzip"
+
+    response = app_client.get(url, headers={"Accept": binary.MIMETYPE, "Accept-Encoding": "gzip"})
+    assert response.mimetype == binary.MIMETYPE
+    assert response.content_encoding is None
+    assert binary.decode_tree(response.data)["smiles"] == "C0"
+
+
+@pytest.mark.parametrize("options", [{"depth": 2}, {"min_likelihood": "Likely"}, {"top_k": 1}, {"max_nodes": 5},
+                                     {"score": True}, {"summary": True}])
+def test_tree_options_are_rejected_for_dag(ctsenvipath, options):
+    ctsenvipath.check_options("tree", **options)
+    with pytest.raises(ValueError):
+        ctsenvipath.check_options("dag", **options)
+
+
+@pytest.mark.parametrize("endpoint", ["run", "stream"])
+def test_dag_with_summary_is_bad_request(app_client, endpoint):
+    response = app_client.get("/envipath/rest/{}?smiles=C0&shape=dag&summary=true".format(endpoint))
+    assert response.status_code == 400
+    assert "summary" in response.get_json()["error"]
+    assert app_client.get("/envipath/rest/{}?smiles=C0&shape=dag".format(endpoint)).status_code == 200
+
+
+@pytest.mark.parametrize("endpoint, query", [(endpoint, query) for endpoint in ["run", "stream", "subtree"]
+                                              for query in ["depth=abc", "top_k=1.5", "max_nodes=", "gen_limit=two"]]
+                         + [("run", "timeout=soon"), ("stream", "timeout=soon")])
+def test_unparsable_numbers_are_bad_requests(app_client, endpoint, query):
+    response = app_client.get("/envipath/rest/{}?smiles=C0&node=n1&{}".format(endpoint, query))
+    assert response.status_code == 400
+    assert query.split("=")[0] in response.get_json()["error"]
+
+
+def test_conditional_get_and_etag_per_representation(app_client):
+    url = "/envipath/rest/run?smiles=C0&gen_limit=2"
+    plain = app_client.get(url)
+    etag = plain.headers["ETag"]
+    assert plain.status_code == 200
+
+    revalidated = app_client.get(url, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+
+    variants = {etag}
+    for headers in ({"Accept-Encoding": "gzip"}, {"Accept": binary.MIMETYPE}):
+        response = app_client.get(url, headers=headers)
+        assert response.headers["ETag"] not in variants
+        variants.add(response.headers["ETag"])
+        # The ETag of another representation does not match
+        for if_none_match, status in ((etag, 200), (response.headers["ETag"], 304)):
+            assert app_client.get(url, headers=dict(headers, **{"If-None-Match": if_none_match})).status_code == status
@@ -0,0 +1,222 @@
+import copy
+import json
+
+import pytest
+
+from conftest import RULES, make_rule_index, random_pathway
+from envipath_tree.binary import decode_tree, encode_tree
+from envipath_tree.link import Link
+from envipath_tree.node import Node
+from envipath_tree.tree import Tree, TreeTooLargeError
+
+
+def recursive_tree(nodes, links):
+    """
+    The metabolite tree as built by the original recursive Tree.recurse_nodes,
+    as nested (smiles, children) tuples.
+    """
+    lst_nodes = [Node(idx, node) for idx, node in enumerate(nodes)]
+    lst_links = [Link(link) for link in links]
+
+    def find_source_links(node_num):
+        return [link for link in lst_links if link.source == node_num]
+
+    def find_target_links(source_num, target_num):
+        return [link for link in lst_links if link.source == source_num and link.target == target_num]
+
+    def recurse(node_num):
+        lst_children = list()
+        for link in find_source_links(node_num):
+            if link.pseudo == True:
+                for target_link in find_source_links(link.target):
+                    for pseudo_target_link in find_target_links(target_link.source, target_link.target):
+                        lst_children.append(pseudo_target_link.target)
+            else:
+                for target_link in find_target_links(link.source, link.target):
+                    lst_children.append(target_link.target)
+        return (lst_nodes[node_num].smiles, [recurse(child) for child in lst_children])
+
+    root = [node.node_num for node in lst_nodes if node.depth == 0][0]
+    return recurse(root)
+
+
+def nested(node):
+    return (node.smiles, [nested(child) for child in node.metabolites])
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.metabolites)
+
+
+def max_level(node):
+    return max([1 + max_level(child) for child in node.metabolites], default=0)
+
+
+def make_tree(df_paths, nodes, links, node_limit=None):
+    return Tree(nodes, links, df_paths, make_rule_index(df_paths, links), node_limit)
+
+
+def chain_pathway():
+    """
+    C0 -(likely)-> C1 -(very likely)-> C2, C0 -(very unlikely)-> C2 and
+    C0 -(neutral)-> pseudo -> C3 + C4.
+    """
+    nodes = [{"id": "n0", "smiles": "C0", "depth": 0}, {"id": "n1", "smiles": "C1", "depth": 1},
+             {"id": "n2", "smiles": "C2", "depth": 2}, {"id": "n3", "smiles": "P3", "depth": 1, "pseudo": True},
+             {"id": "n4", "smiles": "C3", "depth": 1}, {"id": "n5", "smiles": "C4", "depth": 1}]
+    links = [{"id": "l0", "source": 0, "target": 1, "pseudo": False, "idreaction": "Rbt0004"},
+             {"id": "l1", "source": 1, "target": 2, "pseudo": False, "idreaction": "Rbt0005"},
+             {"id": "l2", "source": 0, "target": 2, "pseudo": False, "idreaction": "Rbt0001"},
+             {"id": "l3", "source": 0, "target": 3, "pseudo": True, "idreaction": "Rbt0003"},
+             {"id": "l4", "source": 3, "target": 4, "pseudo": False, "idreaction": "Rbt0003"},
+             {"id": "l5", "source": 3, "target": 5, "pseudo": False, "idreaction": "Rbt0003"}]
+    return nodes, links
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_build_tree_matches_recursion(df_paths, seed):
+    nodes, links = random_pathway(seed)
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree()
+    assert nested(tree.root_node) == recursive_tree(nodes, links)
+
+
+def test_incremental_snapshots_match_full_pathway(df_paths):
+    nodes, links = random_pathway(7)
+    tree = make_tree(df_paths, nodes[:10], [link for link in links if link["target"] < 10 and link["source"] < 10])
+    tree.update(nodes, links)
+    tree.build_tree()
+    assert nested(tree.root_node) == recursive_tree(nodes, links)
+
+
+def test_depth_truncates(df_paths):
+    nodes, links = chain_pathway()
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree(max_depth=1)
+    assert [child.smiles for child in tree.root_node.metabolites] == ["C1", "C2", "C3", "C4"]
+    assert tree.root_node.metabolites[0].truncated
+    assert tree.root_node.metabolites[0].metabolites == []
+    assert max_level(tree.root_node) == 1
+
+
+def test_min_likelihood_and_top_k(df_paths):
+    nodes, links = chain_pathway()
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree(min_likelihood="Likely")
+    assert nested(tree.root_node) == ("C0", [("C1", [("C2", [])])])
+
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree(top_k=2)
+    # Most likely first: C1 (likely), then one of the neutral pseudo products
+    assert [child.smiles for child in tree.root_node.metabolites] == ["C1", "C3"]
+
+
+def test_max_nodes_keeps_first_generations(df_paths):
+    nodes, links = random_pathway(3, num_nodes=60)
+    full = make_tree(df_paths, nodes, links)
+    full.build_tree()
+    first_generation = [child.smiles for child in full.root_node.metabolites]
+
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree(max_nodes=len(first_generation) + 3)
+    assert count_nodes(tree.root_node) == len(first_generation) + 3
+    assert [child.smiles for child in tree.root_node.metabolites] == first_generation
+
+
+def test_node_limit_raises(df_paths):
+    nodes, links = random_pathway(3, num_nodes=60)
+    tree = make_tree(df_paths, nodes, links, node_limit=5)
+    with pytest.raises(TreeTooLargeError):
+        tree.build_tree()
+
+
+@pytest.mark.parametrize("options", [{"max_depth": -1}, {"top_k": -1}, {"max_nodes": 0}, {"max_nodes": "5"},
+                                     {"min_likelihood": "bogus"}])
+def test_check_options(options):
+    with pytest.raises(ValueError):
+        Tree.check_options(**options)
+
+
+def test_build_subtree(df_paths):
+    nodes, links = chain_pathway()
+    tree = make_tree(df_paths, nodes, links)
+    subtree = tree.build_subtree("n1")
+    assert nested(subtree) == ("C1", [("C2", [])])
+    with pytest.raises(ValueError):
+        tree.build_subtree("unknown")
+
+
+def test_score_paths(df_paths):
+    nodes, links = chain_pathway()
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree()
+    ranking = tree.score_paths()
+
+    c1 = tree.root_node.metabolites[0]
+    c2_via_c1 = c1.metabolites[0]
+    c2_direct = tree.root_node.metabolites[1]
+    assert c1.path_likelihood == pytest.approx(0.7)
+    assert c2_via_c1.path_likelihood == pytest.approx(0.7 * 0.9)
+    assert c2_direct.path_likelihood == pytest.approx(0.1)
+    # Both occurrences of C2 know the best one
+    for node in (c2_via_c1, c2_direct):
+        assert node.best_likelihood == pytest.approx(0.63)
+        assert node.best_generation == 2
+    assert c2_direct.generation == 1
+
+    scores = [score for _, score in ranking]
+    assert scores == sorted(scores, reverse=True)
+    assert len(ranking) == 5
+    assert tree.rank_metabolites(top=1)[0]["smiles"] == "C0"
+
+
+def test_metabolite_table(df_paths):
+    nodes, links = chain_pathway()
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree()
+    table = {record["smiles"]: record for record in tree.metabolite_table()}
+
+    assert list(table) == ["C0", "C1", "C2", "C3", "C4"]
+    assert table["C2"]["routes"] == 2
+    assert table["C2"]["min_generation"] == 1
+    assert table["C2"]["best_likelihood"] == pytest.approx(0.63)
+    assert table["C2"]["parents"] == ["C0", "C1"]
+    assert table["C0"]["parents"] == []
+
+
+def test_scoring_requires_built_tree(df_paths):
+    nodes, links = chain_pathway()
+    with pytest.raises(ValueError):
+        make_tree(df_paths, nodes, links).metabolite_table()
+
+
+def test_to_dag_collapses_pseudo_nodes(df_paths):
+    nodes, links = chain_pathway()
+    dag = make_tree(df_paths, nodes, links).to_dag()
+
+    assert dag["root"] == 0
+    assert [node["smiles"] for node in dag["nodes"]] == ["C0", "C1", "C2", "C3", "C4"]
+    edges = {(edge["source"], edge["target"]): edge for edge in dag["edges"]}
+    assert set(edges) == {(0, 1), (1, 2), (0, 2), (0, 4), (0, 5)}
+    assert edges[(0, 4)]["pseudo"] and edges[(0, 4)]["pseudo_id"] == "n3"
+    assert edges[(0, 5)]["pseudo_id"] == "n3"
+    assert not edges[(0, 1)]["pseudo"]
+    assert edges[(1, 2)]["rule"] == "bt0005"
+    assert edges[(1, 2)]["likelihood"] == RULES["bt0005"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_binary_round_trip(df_paths, seed):
+    nodes, links = random_pathway(seed)
+    tree = make_tree(df_paths, nodes, links)
+    tree.build_tree(max_depth=3)
+    tree.score_paths()
+    expected = json.loads(json.dumps(tree.root_node, default=lambda o: o.__dict__))
+
+    assert decode_tree(encode_tree(tree.root_node)) == expected
+    assert decode_tree(encode_tree(copy.deepcopy(expected))) == expected
+
+
+def test_binary_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_tree(b'{"smiles": "C"}')
@@ -0,0 +1,129 @@
+import pytest
+
+from enviPath_python.utils import MultiGenUtils, PathwayGraph, RuleApplicationCache, RuleUtils
+
+
+def graph(nodes, edges, pseudo=()):
+    """
+    PathwayGraph from (smiles, depth) pairs, with the node indices in pseudo as pseudo nodes.
+    """
+    return PathwayGraph([smiles for smiles, _ in nodes], [depth for _, depth in nodes],
+                        [idx in pseudo for idx in range(len(nodes))], edges)
+
+
+def test_pseudo_nodes_resolve_to_their_sources():
+    g = graph([("A", 0), ("P", 1), ("B", 1), ("C", 1), ("D", 2)], [(0, 1), (1, 2), (1, 3), (2, 4)], pseudo={1})
+    assert MultiGenUtils.assemble_upstream(g) == {"B": {"A"}, "C": {"A"}, "D": {"B"}}
+    assert MultiGenUtils.assemble_depths(g) == {"A": 0, "B": 1, "C": 1, "D": 2}
+
+
+def test_compare_graphs_by_depth():
+    data = graph([("A", 0), ("B", 1), ("C", 1), ("D", 2)], [(0, 1), (0, 2), (1, 3)])
+    # B correct, C missing, D found below the wrong parent, E wrong
+    pred = graph([("A", 0), ("B", 1), ("D", 1), ("E", 2)], [(0, 1), (0, 2), (1, 3)])
+
+    res = MultiGenUtils.compare_graphs_by_depth(pred, data)
+
+    assert res[1] == pytest.approx([0.5, 0.5, 0.5, 0.5])
+    assert res[2] == pytest.approx([0.0, 0.0, 0.25, 0.25])
+    assert MultiGenUtils.compare_graphs(pred, data) == pytest.approx((0.5, 0.5, 0.75, 0.75))
+
+
+def test_identical_graphs_are_correct():
+    data = graph([("A", 0), ("P", 1), ("B", 1), ("C", 1)], [(0, 1), (1, 2), (1, 3)], pseudo={1})
+    tp_pred, tp_data, fp, fn = MultiGenUtils.compare_graphs(data, data)
+    assert (tp_pred, tp_data, fp, fn) == pytest.approx((1.0, 1.0, 0.0, 0.0))
+    scores = MultiGenUtils.precision_recall(tp_pred, tp_data, fp, fn)
+    assert (scores["precision"], scores["recall"]) == (1.0, 1.0)
+
+
+def test_extract_graph_from_json():
+    g = MultiGenUtils.extract_graph({
+        "nodes": [{"smiles": "A", "depth": 0}, {"smiles": "B", "depth": 1, "pseudo": True}],
+        "links": [{"source": 0, "target": 1}],
+    })
+    assert g == PathwayGraph(["A", "B"], [0, 1], [False, True], [(0, 1)])
+
+
+class FakePathway:
+    def __init__(self, pathway_id, data, states=("true",), delete_error=None):
+        self.pathway_id = pathway_id
+        self.data = data
+        self.states = list(states)
+        self.delete_error = delete_error
+        self.deleted = False
+
+    def get_id(self):
+        return self.pathway_id
+
+    def get_json(self):
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return dict(self.data, completed=state)
+
+    def delete(self):
+        if self.delete_error:
+            raise RuntimeError(self.delete_error)
+        self.deleted = True
+
+
+class FakePackage:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+    def predict(self, root, name, setting):
+        return self.predictions[name.split()[-1]]
+
+
+def test_evaluate_gives_up_and_deletes_each_prediction():
+    data = {"nodes": [{"smiles": "A", "depth": 0}, {"smiles": "B", "depth": 1}], "links": [{"source": 0, "target": 1}]}
+    references = [FakePathway(pathway_id, data) for pathway_id in ["done", "stuck", "broken"]]
+    predictions = {
+        "done": FakePathway("p-done", data, states=("false", "true"), delete_error="gone"),
+        "stuck": FakePathway("p-stuck", data, states=("false",)),
+        "broken": FakePathway("p-broken", data, states=("error",)),
+    }
+
+    res = MultiGenUtils.evaluate(references, None, FakePackage(predictions), max_workers=2, poll_interval=0.05,
+                                 max_wait=0.5, cleanup=True)
+
+    assert res["evaluated"] == 1
+    assert res["overall"]["precision"] == 1.0
+    assert set(res["failed"]) == {"stuck", "broken"}
+    assert "0.5 seconds" in res["failed"]["stuck"]
+    # A failed deletion does not stop the others
+    assert predictions["stuck"].deleted and predictions["broken"].deleted
+
+
+class FakeRule:
+    def __init__(self, rule_id, calls):
+        self.rule_id = rule_id
+        self.calls = calls
+
+    def get_id(self):
+        return self.rule_id
+
+    def apply_to_smiles(self, smiles):
+        self.calls.append((self.rule_id, smiles))
+        return ["{}({})".format(self.rule_id, smiles)]
+
+
+def test_apply_rules_sends_each_pair_once(tmp_path):
+    calls = list()
+    rules = [FakeRule("r1", calls), FakeRule("r2", calls), FakeRule("r1", calls)]
+    smiles = ["A", "B", "A"]
+    cache = RuleApplicationCache(str(tmp_path / "rules.db"))
+    cache.put("r2", "B", ["cached"])
+
+    res = RuleUtils.apply_rules(rules, smiles, cache=cache, max_workers=2)
+
+    assert sorted(calls) == [("r1", "A"), ("r1", "B"), ("r2", "A")]
+    assert res == [[["r1(A)"], ["r1(B)"], ["r1(A)"]],
+                   [["r2(A)"], ["cached"], ["r2(A)"]],
+                   [["r1(A)"], ["r1(B)"], ["r1(A)"]]]
+    assert cache.get("r1", "B") == ["r1(B)"]
+
+    # Everything is cached now
+    calls.clear()
+    assert RuleUtils.apply_rules(rules, smiles, cache=cache) == res
+    assert calls == []
+    cache.close()